@@ -1,15 +1,92 @@
 # ai_reviewer.py
 
-import openai
-import os
+import argparse
+import itertools
+import json
+import logging
 import sys
-from dotenv import load_dotenv
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from batching import (DEFAULT_BATCH_TOKENS, DEFAULT_SMALL_FILE_TOKENS, iter_batches,
+                      get_file_section, get_batch_prompt, split_batch_response)
+from chunker import count_tokens, chunk_code, get_chunk_prompt, merge_reviews, number_lines
+from compaction import Compaction, compact_code, remap_line_refs, remap_review
+from dedup import (DEFAULT_SIMILARITY, DuplicateIndex, delta_diff, line_anchored, map_lines, pack_hunks,
+                   remap_bullets, sketch)
+from diff_review import get_git_diff, parse_unified_diff, get_hunk_prompt, map_findings
+from findings import JSON_FORMAT, Finding, dedupe_findings, parse_findings, to_sarif
+from languages import detect_language, parse_languages
+from llm_backend import MODEL, TEMPERATURE, configure_limits, get_backend
+from metrics import log_event, metrics, serve_metrics, summary as metrics_summary, timed
+from review_cache import ReviewCache, cache_key, DEFAULT_CACHE_DIR
+from repo_walker import DEFAULT_WALK_JOBS, walk_repo
+from review_engine import run_reviews, run_streaming
+from review_state import DEFAULT_STATE_FILE, ReviewState, StateDiff
+from static_rules import run_rules, only_trivial
+from symbol_index import DEFAULT_CONTEXT_TOKENS, DEFAULT_INDEX_FILE, SymbolIndex
 
-def get_review_prompt(code: str, filename: str) -> str:
-    file_type = "SQL" if filename.endswith(".sql") else "Python"
+PROMPT_VERSION = "cli-v1"  # bump whenever get_review_prompt changes
+DEFAULT_JOBS = 4
+DEFAULT_TIMEOUT = 120  # seconds per API request
+DEFAULT_DIFF_CONTEXT = 3  # unchanged lines sent around each hunk
+DEFAULT_MAX_PROMPT_TOKENS = 6000  # larger files are split and reviewed in chunks
+OUTPUT_FORMATS = ("text", "jsonl", "sarif")
+# Text findings that cite their line, so --dedup can carry them over to a near-copy
+ANCHORED_FORMAT = """Provide clear, bullet-point feedback with explanations. Start every bullet with the
+line number it refers to, written as `L<number>:`."""
+
+@dataclass
+class ReviewOptions:
+    timeout: float = DEFAULT_TIMEOUT
+    cache: ReviewCache = None
+    refresh: bool = False
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS
+    jobs: int = DEFAULT_JOBS
+    rules: bool = True
+    skip_llm_on_trivial: bool = False
+    batch_tokens: int = DEFAULT_BATCH_TOKENS
+    small_file_tokens: int = DEFAULT_SMALL_FILE_TOKENS
+    structured: bool = False  # ask the model for JSON findings instead of markdown
+    state: ReviewState = None  # previous run's results, for incremental reviews
+    compact: bool = False  # strip low-value content from prompts, mapping findings back to original lines
+    symbols: SymbolIndex = None  # repository definitions quoted in prompts for cross-file awareness
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    dedup: bool = False  # review near-copies of earlier files as deltas against them
+    dedup_similarity: float = DEFAULT_SIMILARITY
+
+    @property
+    def prompt_version(self) -> str:
+        return (PROMPT_VERSION + ("+json" if self.structured else "") + ("+compact" if self.compact else "")
+                + ("+context" if self.symbols else "") + ("+anchored" if self.anchored else ""))
+
+    @property
+    def anchored(self) -> bool:
+        return self.dedup and not self.structured
+
+    @property
+    def response_format(self) -> str:
+        return JSON_FORMAT if self.structured else None
+
+    @property
+    def prompt_format(self) -> str:
+        # Whole-file and batch prompts; chunk and hunk prompts always ask for cited lines
+        return ANCHORED_FORMAT if self.anchored else self.response_format
+
+def get_file_type(filename: str, code: str = None) -> str:
+    head = code[:100].encode("utf-8") if code else None
+    return detect_language(filename, head) or "source"
+
+def get_review_prompt(code: str, filename: str, response_format: str = None, context: str = "") -> str:
+    file_type = get_file_type(filename, code)
+    if response_format:
+        # Findings that cite line numbers need them shown next to the code
+        line_count = code.count("\n") + 1
+        response_format = f"{response_format}\n\nLines: 1-{line_count}"
+        code = number_lines(code, 1)
+    response_format = response_format or "Provide clear, bullet-point feedback with explanations."
+    context = f"{context}\n\n" if context else ""
     return f"""
 You are a senior software reviewer. Analyze this {file_type} code file.
 
@@ -21,40 +98,831 @@ Identify and comment on:
 - Missing edge-case or error handling
 - Security and style violations
 
-Provide clear, bullet-point feedback with explanations.
+{response_format}
 
-Filename: {filename}
+{context}Filename: {filename}
 
 Code:
 {code}
 """
 
-def analyze_file(file_path: str):
+def request_review(prompt: str, timeout: float = DEFAULT_TIMEOUT) -> str:
+    return get_backend().review(prompt, timeout)
+
+def review_in_chunks(code: str, file_path: str, max_tokens: int, timeout: float, jobs: int,
+                     response_format: str = None, context: str = "") -> str:
+    file_type = get_file_type(file_path, code)
+    # Leave room for the instructions that wrap every chunk
+    sample = chunk_code("x", file_path, 1)[0]
+    overhead = count_tokens(get_chunk_prompt(sample, file_path, file_type, 1, 1, response_format, context))
+    chunks = chunk_code(code, file_path, max(max_tokens - overhead, 1))
+    prompts = [get_chunk_prompt(chunk, file_path, file_type, i, len(chunks), response_format, context)
+               for i, chunk in enumerate(chunks, start=1)]
+    reviews = [review for _, review in run_reviews(prompts, lambda p: request_review(p, timeout), jobs=jobs)]
+    if not response_format:
+        return merge_reviews(reviews)
+    # Validate each chunk against its own line range, then store one combined JSON array
+    findings = [f for chunk, review in zip(chunks, reviews)
+                for f in parse_findings(review, file_path, chunk.start_line, chunk.end_line)]
+    return json.dumps([f.to_dict() for f in dedupe_findings(findings)])
+
+@dataclass
+class FileReview:
+    path: str
+    index: int = 0
+    code: str = None
+    findings: List[Finding] = field(default_factory=list)
+    review: str = None
+    error: str = None
+    failure: str = None  # why the LLM review failed, after retries
+    cache_key: str = None
+    unchanged: bool = False  # same content and prompt as the last recorded run
+    compaction: Compaction = None
+    context: str = ""  # cross-file context from the symbol index
+    duplicate_of: str = None  # path of the earlier file whose review was reused
+    similarity: float = None  # estimated, for near-copies; None when the copy is exact
+
+    @property
+    def pending(self) -> bool:
+        return self.error is None and self.review is None
+
+    def report(self) -> str:
+        if self.error:
+            return self.error
+        static = format_rule_findings(self.findings)
+        if not self.review:
+            return static or "✅ No issues found."
+        review = self.review
+        if self.duplicate_of and self.similarity is None:
+            review = f"♻️ Same code as `{self.duplicate_of}`; its review is reused.\n{review}"
+        elif self.duplicate_of:
+            review = (f"♻️ {min(self.similarity, 0.99):.0%} similar to `{self.duplicate_of}`; its review is reused for unchanged "
+                      f"lines and only the changes were reviewed.\n{review}")
+        return f"{static}\n\n🤖 AI review:\n{review}" if static else review
+
+    def all_findings(self) -> List[Finding]:
+        """Static findings plus the validated LLM findings, ordered by line."""
+        found = list(self.findings)
+        if self.review and not self.failure:
+            found += parse_findings(self.review, self.path, 1, self.code.count("\n") + 1)
+        return sorted(dedupe_findings(found), key=lambda f: (f.line_start, f.line_end))
+
+def prepare_file(file_path: str, options: ReviewOptions, index: int = 0) -> FileReview:
+    """Read a file, run the static checks and look up a cached review."""
     try:
-        with open(file_path, "r") as f:
+        with timed("read", file=file_path), open(file_path, "r") as f:
             code = f.read()
     except Exception as e:
-        return f"❌ Error reading file `{file_path}`: {e}"
+        return FileReview(file_path, index, error=f"❌ Error reading file `{file_path}`: {e}")
+    return prepare_code(file_path, code, options, index)
+
+def prepare_code(file_path: str, code: str, options: ReviewOptions, index: int = 0) -> FileReview:
+    """Run the static checks on code already in memory and look up a cached review."""
+    file_review = FileReview(file_path, index, code)
+    if options.rules:
+        with timed("rules", file=file_path):
+            file_review.findings = run_rules(file_review.code, file_path)
+    if options.skip_llm_on_trivial and only_trivial(file_review.findings):
+        file_review.review = ""
+        return file_review
+
+    file_review.context = repo_context(file_review.code, file_path, options)
+    file_review.cache_key = review_key(file_review.code, file_path, options, file_review.context)
+    if options.state and not options.refresh:
+        file_review.review = options.state.lookup(file_path, file_review.cache_key)
+        file_review.unchanged = file_review.review is not None
+    if options.cache and not options.refresh and file_review.review is None:
+        file_review.review = options.cache.get(file_review.cache_key)
+    if options.compact and file_review.review is None:
+        file_review.compaction = compact_for_review(file_review.code, file_path)
+    return file_review
+
+def review_batch(file_reviews: List[FileReview], options: ReviewOptions) -> None:
+    """Review several small files with one request; files missing from the answer stay pending."""
+    with timed("prompt", files=len(file_reviews)):
+        sections = [file_section(fr, options) for fr in file_reviews]
+        response_format = options.prompt_format
+        if response_format:
+            response_format = f"Under each header, write that file's findings. {response_format}"
+        prompt = get_batch_prompt(sections, response_format)
+    response = request_review(prompt, options.timeout)
+    reviews = split_batch_response(response, [fr.path for fr in file_reviews])
+    for fr in file_reviews:
+        if fr.path in reviews:
+            fr.review = reviews[fr.path]
+            if fr.compaction:
+                fr.review = remap_review(fr.review, fr.compaction, fr.path, options.structured)
+            if options.cache:
+                options.cache.put(fr.cache_key, fr.review)
+
+def complete_reviews(file_reviews: List[FileReview], options: ReviewOptions) -> List[FileReview]:
+    """Fill in the LLM review for one work unit: a single file or a packed batch of small files."""
+    pending = [fr for fr in file_reviews if fr.pending]
+    if len(pending) > 1:
+        try:
+            review_batch(pending, options)
+        except Exception:
+            pass  # fall back to one request per file below
+    for fr in pending:
+        if not fr.pending:
+            continue
+        try:
+            # prepare_file already looked the file up in the cache
+            fr.review = review_code(fr.code, fr.path, options, lookup=False, context=fr.context)
+        except Exception as e:
+            fr.failure = f"{fr.path}: {e}"
+            fr.review = f"❌ LLM error for {fr.failure}"
+    return file_reviews
+
+def file_section(file_review: FileReview, options: ReviewOptions) -> str:
+    code = file_review.compaction.text if file_review.compaction else file_review.code
+    if options.prompt_format:
+        code = number_lines(code, 1)
+    return get_file_section(code, file_review.path, get_file_type(file_review.path, file_review.code),
+                            file_review.context)
+
+def review_files(paths, options: ReviewOptions) -> Iterator[FileReview]:
+    """Review files concurrently, packing small ones together, and yield them in input order."""
+    return review_prepared((prepare_file(path, options, index) for index, path in enumerate(paths)), options)
+
+def review_sources(sources, options: ReviewOptions) -> Iterator[FileReview]:
+    """Like review_files, for (path, code) pairs that are already in memory."""
+    return review_prepared((prepare_code(path, code, options, index)
+                            for index, (path, code) in enumerate(sources)), options)
+
+def review_prepared(prepared: Iterator[FileReview], options: ReviewOptions) -> Iterator[FileReview]:
+    if options.dedup:
+        yield from review_deduplicated(prepared, options)
+        return
+    if options.batch_tokens > 0:
+        cost = lambda fr: count_tokens(file_section(fr, options)) if fr.pending else None
+        units = iter_batches(prepared, cost, options.batch_tokens, options.small_file_tokens)
+    else:
+        units = ([fr] for fr in prepared)
 
-    prompt = get_review_prompt(code, file_path)
+    done = {}
+    next_index = 0
+    for _, reviewed in run_reviews(units, lambda unit: complete_reviews(unit, options), jobs=options.jobs):
+        for fr in reviewed:
+            done[fr.index] = fr
+        while next_index in done:
+            yield done.pop(next_index)
+            next_index += 1
 
+def review_deduplicated(prepared: Iterator[FileReview], options: ReviewOptions) -> Iterator[FileReview]:
+    """Like review_prepared, but a file that copies an earlier one waits for that file's review and
+    reuses it: verbatim for an exact copy, or for a near-copy on the unchanged lines plus a review of
+    the changed hunks."""
+    index = DuplicateIndex(options.dedup_similarity)
+    representatives = {}  # index -> FileReview that other files may reuse
+    finished = set()
+    waiting = {}  # representative index -> [(duplicate, match)] until its review is done
+    results = {}  # index -> FileReview, or Future of a duplicate's review
+    pool = ThreadPoolExecutor(max_workers=max(1, options.jobs))
+
+    def start(duplicate: FileReview, match) -> None:
+        results[duplicate.index] = pool.submit(review_duplicate, duplicate, representatives[match.key], match, options)
+
+    def split_duplicates(stream: Iterator[FileReview]) -> Iterator[FileReview]:
+        # Runs on the caller's thread, in input order, as run_reviews pulls work
+        for fr in stream:
+            fingerprint = sketch(fr.code) if fr.code is not None else None
+            match = index.find(fingerprint) if fingerprint else None
+            if match is None or not fr.pending:
+                if fingerprint and match is None:
+                    index.add(fr.index, fingerprint)
+                    representatives[fr.index] = fr
+                yield fr
+            elif match.key in finished:
+                start(fr, match)
+            else:
+                waiting.setdefault(match.key, []).append((fr, match))
+
+    units = split_duplicates(prepared)
+    if options.batch_tokens > 0:
+        cost = lambda fr: count_tokens(file_section(fr, options)) if fr.pending else None
+        units = iter_batches(units, cost, options.batch_tokens, options.small_file_tokens)
+    else:
+        units = ([fr] for fr in units)
+
+    next_index = 0
     try:
-        print(f"\n🔍 Reviewing: {file_path}")
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a professional code reviewer."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2
-        )
-        print(response.choices[0].message.content.strip())
+        for _, reviewed in run_reviews(units, lambda unit: complete_reviews(unit, options), jobs=options.jobs):
+            for fr in reviewed:
+                results[fr.index] = fr
+                finished.add(fr.index)
+                for duplicate, match in waiting.pop(fr.index, []):
+                    start(duplicate, match)
+            while next_index in results:
+                result = results.pop(next_index)
+                yield result.result() if isinstance(result, Future) else result
+                next_index += 1
+        # Every representative is done by now, so every duplicate has been started
+        for i in sorted(results):
+            result = results[i]
+            yield result.result() if isinstance(result, Future) else result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def review_duplicate(duplicate: FileReview, representative: FileReview, match, options: ReviewOptions) -> FileReview:
+    if representative.failure or representative.error or not representative.review:
+        # Nothing reusable (failed, or skipped as trivial): review the file on its own
+        return complete_reviews([duplicate], options)[0]
+    if not match.exact and not options.structured and not line_anchored(representative.review):
+        # Whole-file markdown reviews do not cite lines, so findings on unchanged lines cannot be told apart
+        return complete_reviews([duplicate], options)[0]
+    try:
+        if match.exact:
+            review = representative.review
+        else:
+            review = review_delta(duplicate, representative, options)
     except Exception as e:
-        print(f"❌ OpenAI error for {file_path}: {e}")
+        duplicate.failure = f"{duplicate.path}: {e}"
+        duplicate.review = f"❌ LLM error for {duplicate.failure}"
+        return duplicate
+    duplicate.review = review
+    duplicate.duplicate_of = representative.path
+    duplicate.similarity = None if match.exact else match.similarity
+    if options.cache:
+        options.cache.put(duplicate.cache_key, review)
+    metrics.inc("duplicates_total", 1, "Files reviewed by reusing an earlier file's review",
+                kind="exact" if match.exact else "near")
+    log_event("duplicate", file=duplicate.path, of=representative.path, similarity=round(match.similarity, 3))
+    return duplicate
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ai_reviewer.py <file1.sql> [file2.py] ...")
+def review_delta(duplicate: FileReview, representative: FileReview, options: ReviewOptions) -> str:
+    """Reuse the representative's review on unchanged lines and review only the changed hunks."""
+    line_map = map_lines(representative.code, duplicate.code)
+    diffs = parse_unified_diff(delta_diff(representative.code, duplicate.code, duplicate.path, DEFAULT_DIFF_CONTEXT))
+    hunks = pack_hunks(diffs[0].hunks, options.max_prompt_tokens // 2) if diffs else []
+    if options.structured:
+        found = []
+        for finding in parse_findings(representative.review, duplicate.path, 1, representative.code.count("\n") + 1):
+            if finding.line_start in line_map:
+                finding.line_start = line_map[finding.line_start]
+                finding.line_end = max(line_map.get(finding.line_end, finding.line_start), finding.line_start)
+                found.append(finding)
+        for _, changed in run_reviews(hunks, lambda hunk: hunk_findings(diffs[0], hunk, options), jobs=options.jobs):
+            found += changed
+        return json.dumps([f.to_dict() for f in dedupe_findings(found)])
+    reviews = [remap_bullets(representative.review, line_map)]
+    reviews += [review for _, review in run_reviews(hunks, lambda hunk: review_hunk(diffs[0], hunk, options),
+                                                    jobs=options.jobs)]
+    return merge_reviews(reviews)
+
+def analyze_file(file_path: str, options: ReviewOptions = None) -> str:
+    options = options or ReviewOptions()
+    file_review = prepare_file(file_path, options)
+    complete_reviews([file_review], options)
+    return file_review.report()
+
+def record_state(file_review: FileReview, findings: List[Finding], options: ReviewOptions) -> StateDiff:
+    """Save a finished file to the state DB and mark its findings new or unchanged since the last run."""
+    if options.state is None or file_review.error or file_review.failure:
+        return None
+    diff = options.state.update(file_review.path, file_review.cache_key, file_review.review,
+                                findings, file_review.code)
+    for status, found in (("new", diff.new), ("unchanged", diff.unchanged), ("resolved", diff.resolved)):
+        for finding in found:
+            finding.baseline = status
+    return diff
+
+def format_state_diff(diff: StateDiff) -> str:
+    text = f"📈 Since last run: {diff.summary()}"
+    if diff.resolved:
+        text += "\n✔️ Resolved:\n" + "\n".join(f.to_markdown() for f in diff.resolved)
+    return text
+
+def format_rule_findings(findings) -> str:
+    if not findings:
+        return ""
+    return "🧹 Static checks:\n" + "\n".join(f.to_markdown() for f in findings)
+
+def compact_for_review(code: str, file_path: str) -> Compaction:
+    with timed("compact", file=file_path):
+        return compact_code(code, file_path)
+
+def repo_context(code: str, file_path: str, options: ReviewOptions) -> str:
+    """Signatures of symbols the file uses from elsewhere in the repository, or "" without an index."""
+    if options.symbols is None:
+        return ""
+    with timed("context", file=file_path):
+        return options.symbols.context_for(code, file_path, options.context_tokens)
+
+def review_key(code: str, file_path: str, options: ReviewOptions, context: str = "") -> str:
+    parts = (options.prompt_version, MODEL, TEMPERATURE, get_file_type(file_path, code), code)
+    return cache_key(*parts, context) if context else cache_key(*parts)
+
+def review_code(code: str, file_path: str, options: ReviewOptions = None, lookup: bool = True,
+                context: str = None) -> str:
+    options = options or ReviewOptions()
+    cache = options.cache
+    if context is None:
+        context = repo_context(code, file_path, options)
+    key = review_key(code, file_path, options, context)
+    if cache and lookup and not options.refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    compaction = compact_for_review(code, file_path) if options.compact else None
+    source = compaction.text if compaction else code
+    with timed("prompt", file=file_path):
+        prompt = get_review_prompt(source, file_path, options.prompt_format, context)
+        prompt_tokens = count_tokens(prompt)
+
+    if prompt_tokens > options.max_prompt_tokens:
+        review = review_in_chunks(source, file_path, options.max_prompt_tokens, options.timeout, options.jobs,
+                                  options.response_format, context)
     else:
-        for file in sys.argv[1:]:
-            analyze_file(file)
+        review = request_review(prompt, options.timeout)
+    if compaction:
+        review = remap_review(review, compaction, file_path, options.structured)
+
+    if cache:
+        cache.put(key, review)
+    return review
+
+def stream_review_code(code: str, file_path: str, options: ReviewOptions = None) -> Iterator[str]:
+    """Like review_code, but yield the review in pieces as the model generates it."""
+    options = options or ReviewOptions()
+    cache = options.cache
+    context = repo_context(code, file_path, options)
+    key = review_key(code, file_path, options, context)
+    if cache and not options.refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    compaction = compact_for_review(code, file_path) if options.compact else None
+    source = compaction.text if compaction else code
+    with timed("prompt", file=file_path):
+        prompt = get_review_prompt(source, file_path, options.prompt_format, context)
+        prompt_tokens = count_tokens(prompt)
+
+    if prompt_tokens > options.max_prompt_tokens:
+        # Chunk reviews are merged at the end, so there is nothing to stream early
+        review = review_in_chunks(source, file_path, options.max_prompt_tokens, options.timeout, options.jobs,
+                                  options.response_format, context)
+        if compaction:
+            review = remap_review(review, compaction, file_path, options.structured)
+        yield review
+    elif compaction:
+        # Line references can only be mapped back once their line is complete
+        lines = []
+        buffered = ""
+        for piece in get_backend().review_stream(prompt, options.timeout):
+            buffered += piece
+            if "\n" in buffered:
+                complete, buffered = buffered.rsplit("\n", 1)
+                complete = remap_line_refs(complete, compaction)
+                lines.append(complete)
+                yield complete + "\n"
+        buffered = remap_line_refs(buffered, compaction)
+        lines.append(buffered)
+        yield buffered
+        review = "\n".join(lines).strip()
+    else:
+        pieces = []
+        for piece in get_backend().review_stream(prompt, options.timeout):
+            pieces.append(piece)
+            yield piece
+        review = "".join(pieces).strip()
+
+    if cache:
+        cache.put(key, review)
+
+def stream_file(file_path: str, options: ReviewOptions) -> Iterator[str]:
+    """Yield a file's report incrementally: static checks first, then the AI review as it streams."""
+    file_review = prepare_file(file_path, options)
+    if not file_review.pending:
+        yield file_review.report()
+        return
+
+    static = format_rule_findings(file_review.findings)
+    if static:
+        yield f"{static}\n\n🤖 AI review:\n"
+    yield from stream_review_code(file_review.code, file_path, options)
+
+def stream_hunk(file_diff, hunk, options: ReviewOptions) -> Iterator[str]:
+    """Stream a hunk review line by line, mapping line references as each line completes."""
+    prompt = get_hunk_prompt(file_diff, hunk, get_file_type(file_diff.path))
+    key = cache_key(options.prompt_version, MODEL, TEMPERATURE, "hunk", prompt)
+    cached = None if (options.cache is None or options.refresh) else options.cache.get(key)
+    if cached is not None:
+        yield map_findings(cached, file_diff, hunk)
+        return
+
+    pieces = []
+    buffered = ""
+    for piece in get_backend().review_stream(prompt, options.timeout):
+        pieces.append(piece)
+        buffered += piece
+        if "\n" in buffered:
+            complete, buffered = buffered.rsplit("\n", 1)
+            yield map_findings(complete, file_diff, hunk) + "\n"
+    yield map_findings(buffered, file_diff, hunk)
+    if options.cache:
+        options.cache.put(key, "".join(pieces).strip())
+
+def review_hunk(file_diff, hunk, options: ReviewOptions) -> str:
+    """Return the raw (cached) model answer for one diff hunk."""
+    cache = options.cache
+    prompt = get_hunk_prompt(file_diff, hunk, get_file_type(file_diff.path), options.response_format)
+
+    key = cache_key(options.prompt_version, MODEL, TEMPERATURE, "hunk", prompt)
+    review = None if (cache is None or options.refresh) else cache.get(key)
+    if review is None:
+        review = request_review(prompt, options.timeout)
+        if cache:
+            cache.put(key, review)
+    return review
+
+def analyze_hunk(file_diff, hunk, options: ReviewOptions = None) -> str:
+    """Review one diff hunk; LLM errors are raised so callers can report the hunk as failed."""
+    options = options or ReviewOptions()
+    return map_findings(review_hunk(file_diff, hunk, options), file_diff, hunk)
+
+def hunk_findings(file_diff, hunk, options: ReviewOptions) -> List[Finding]:
+    """Structured findings for one hunk, keeping only those that point at lines shown in it."""
+    valid_lines = {line_no for _, _, line_no in hunk.lines if line_no is not None}
+    review = review_hunk(file_diff, hunk, options)
+    found = parse_findings(review, file_diff.path, hunk.new_start, hunk.new_end)
+    return [f for f in found if f.line_start in valid_lines]
+
+def print_stream(pieces: Iterator[str], label: str) -> str:
+    """Print pieces as they arrive; return an error message if the stream failed."""
+    text = ""
+    error = None
+    try:
+        for piece in pieces:
+            text += piece
+            print(piece, end="", flush=True)
+    except Exception as e:
+        error = f"{label}: {e}"
+        text += f"\n❌ LLM error for {error}"
+        print(f"\n❌ LLM error for {error}", end="")
+    if not text.endswith("\n"):
+        print()
+    return error
+
+def report_failures(failures: List[str], total: int, out=None) -> int:
+    if not failures:
+        return 0
+    print(f"\n⚠️ {len(failures)} of {total} reviews failed after retries:", file=out)
+    for failure in failures:
+        print(f"  - {failure}", file=out)
+    return 1
+
+class FindingsWriter:
+    """Write findings as JSON lines as soon as each file is done, or as one SARIF log at the end."""
+
+    def __init__(self, output_format: str, out=None):
+        self.output_format = output_format
+        self.out = out or sys.stdout
+        self.collected = []
+
+    def write(self, findings: List[Finding]) -> None:
+        if self.output_format == "sarif":
+            self.collected.extend(findings)
+            return
+        for finding in findings:
+            self.out.write(json.dumps(finding.to_dict()) + "\n")
+        self.out.flush()
+
+    def close(self) -> None:
+        if self.output_format == "sarif":
+            json.dump(to_sarif(self.collected), self.out, indent=2)
+            self.out.write("\n")
+        self.out.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="AI-powered code review for .sql and .py files",
+        usage="python ai_reviewer.py [options] <file1.sql> [file2.py] ...\n"
+              "       python ai_reviewer.py [options] --repo DIR\n"
+              "       python ai_reviewer.py [options] --diff BASE..HEAD [paths ...]"
+    )
+    parser.add_argument("files", nargs="*",
+                        help="files to review (with --diff: limit the diff to these paths)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of files reviewed concurrently (default: {DEFAULT_JOBS})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"per-request timeout in seconds (default: {DEFAULT_TIMEOUT})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="neither read nor write the review cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached reviews but store the fresh results")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"review cache location (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--repo", metavar="DIR",
+                        help="review every source file under DIR, honoring .gitignore")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="with --repo: skip paths matching this gitignore-style pattern (repeatable)")
+    parser.add_argument("--languages", default="sql,python",
+                        help="with --repo: comma-separated languages to review, or 'all' (default: sql,python)")
+    parser.add_argument("--walk-jobs", type=int, default=DEFAULT_WALK_JOBS,
+                        help=f"with --repo: directories listed concurrently (default: {DEFAULT_WALK_JOBS})")
+    parser.add_argument("--diff", metavar="BASE..HEAD",
+                        help="review only the hunks changed between two git revisions")
+    parser.add_argument("--git-repo", default=".",
+                        help="git repository used by --diff (default: current directory)")
+    parser.add_argument("--context", type=int, default=DEFAULT_DIFF_CONTEXT,
+                        help=f"context lines around each hunk in --diff mode (default: {DEFAULT_DIFF_CONTEXT})")
+    parser.add_argument("--max-prompt-tokens", type=int, default=DEFAULT_MAX_PROMPT_TOKENS,
+                        help="files whose prompt exceeds this many tokens are reviewed in chunks "
+                             f"(default: {DEFAULT_MAX_PROMPT_TOKENS})")
+    parser.add_argument("--no-rules", action="store_true",
+                        help="skip the built-in static checks that run before the LLM")
+    parser.add_argument("--skip-llm-on-trivial", action="store_true",
+                        help="do not call the LLM for files whose only static-check hits are low severity")
+    parser.add_argument("--batch-tokens", type=int, default=DEFAULT_BATCH_TOKENS,
+                        help="pack small files into shared requests of up to this many tokens; 0 disables "
+                             f"(default: {DEFAULT_BATCH_TOKENS})")
+    parser.add_argument("--small-file-tokens", type=int, default=DEFAULT_SMALL_FILE_TOKENS,
+                        help=f"largest file eligible for packing, in tokens (default: {DEFAULT_SMALL_FILE_TOKENS})")
+    parser.add_argument("--stream", action="store_true",
+                        help="print each review as it is generated (disables packing of small files)")
+    parser.add_argument("--rpm", type=float,
+                        help="requests-per-minute budget shared by all workers; 0 means unlimited "
+                             "(default: $AI_REVIEWER_RPM, else unlimited)")
+    parser.add_argument("--tpm", type=float,
+                        help="tokens-per-minute budget shared by all workers; 0 means unlimited "
+                             "(default: $AI_REVIEWER_TPM, else unlimited)")
+    parser.add_argument("--max-retries", type=int,
+                        help="retries for rate-limited or transient API errors "
+                             "(default: $AI_REVIEWER_MAX_RETRIES, else 5)")
+    parser.add_argument("--state", nargs="?", const=DEFAULT_STATE_FILE, metavar="PATH",
+                        help="remember findings between runs in a SQLite file; unchanged files are not re-sent "
+                             f"and findings are reported as new/resolved/unchanged (default path: {DEFAULT_STATE_FILE})")
+    parser.add_argument("--log-metrics", action="store_true",
+                        help="log per-stage timings and token counts as JSON lines on stderr, plus a summary")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="write Prometheus text-format metrics to PATH when the run ends")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--compact", action="store_true",
+                        help="drop license headers, long comments and data literals from prompts to save tokens; "
+                             "findings still point at the original lines")
+    parser.add_argument("--symbols", nargs="?", const="", metavar="PATH",
+                        help="add the signatures of symbols each file uses from elsewhere in the repository "
+                             "(and likely misspellings) to its prompt; the symbol index is kept in PATH "
+                             f"(default: {DEFAULT_INDEX_FILE} in the --repo directory, or the current one)")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS,
+                        help=f"token budget for that context per file (default: {DEFAULT_CONTEXT_TOKENS})")
+    parser.add_argument("--dedup", action="store_true",
+                        help="review copy-pasted files once: exact copies reuse the earlier review, near-copies "
+                             "are reviewed as a delta against it")
+    parser.add_argument("--dedup-similarity", type=float, default=DEFAULT_SIMILARITY,
+                        help=f"similarity (0-1) at which a file counts as a near-copy (default: {DEFAULT_SIMILARITY})")
+    parser.add_argument("--server", metavar="URL",
+                        help="send the files or diff to a running review_server.py instead of reviewing locally")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text",
+                        help="text report, JSON lines with one finding each, or a SARIF log (default: text)")
+    args = parser.parse_args(argv)
+
+    if not args.files and not args.diff and not args.repo:
+        parser.error("give at least one file, --repo DIR or --diff BASE..HEAD")
+    if args.repo and args.diff:
+        parser.error("--repo and --diff cannot be combined")
+    try:
+        languages = parse_languages(args.languages)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.stream and args.format != "text":
+        parser.error("--stream only works with --format text")
+    if args.state and (args.stream or args.diff):
+        parser.error("--state works with whole-file reviews only, not --stream or --diff")
+    if args.server and (args.state or args.stream):
+        parser.error("--server cannot be combined with --state or --stream")
+    if args.symbols is not None and (args.diff or args.server):
+        parser.error("--symbols works with local whole-file reviews only, not --diff or --server")
+
+    configure_limits(args.rpm, args.tpm, args.max_retries)
+    options = ReviewOptions(
+        timeout=args.timeout,
+        cache=None if args.no_cache else ReviewCache(args.cache_dir),
+        refresh=args.refresh,
+        max_prompt_tokens=args.max_prompt_tokens,
+        jobs=args.jobs,
+        rules=not args.no_rules,
+        skip_llm_on_trivial=args.skip_llm_on_trivial,
+        batch_tokens=args.batch_tokens,
+        small_file_tokens=args.small_file_tokens,
+        structured=args.format != "text",
+        state=ReviewState(args.state) if args.state else None,
+        compact=args.compact,
+        symbols=load_symbols(args) if args.symbols is not None else None,
+        context_tokens=args.context_tokens,
+        dedup=args.dedup,
+        dedup_similarity=args.dedup_similarity
+    )
+    if args.log_metrics:
+        logging.basicConfig(level=logging.WARNING, format="%(message)s")
+        logging.getLogger("ai_reviewer.metrics").setLevel(logging.DEBUG)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    try:
+        return run_review(args, options, languages)
+    finally:
+        if args.metrics_file:
+            metrics.write(args.metrics_file)
+        if args.log_metrics:
+            print(metrics_summary(), file=sys.stderr)
+
+def load_symbols(args) -> SymbolIndex:
+    """Load the repository's symbol index and bring it up to date with the working tree."""
+    symbols = SymbolIndex.load(args.repo or ".", args.symbols or None)
+    with timed("index"):
+        changed = symbols.refresh(args.exclude, args.walk_jobs)
+    if changed:
+        try:
+            symbols.save()
+        except OSError as e:
+            print(f"⚠️ Could not save the symbol index to {symbols.path}: {e}", file=sys.stderr)
+    return symbols
+
+def run_review(args, options: ReviewOptions, languages) -> int:
+    """Review the files, repository or diff selected on the command line; return the exit code."""
+    paths = args.files
+    if args.repo:
+        # Files are reviewed as the walk finds them instead of after listing the whole tree
+        paths = itertools.chain(args.files, walk_repo(args.repo, args.exclude, languages, args.walk_jobs))
+    if args.server:
+        return review_remote(args, paths)
+    if options.structured:
+        return review_structured(args, options, paths)
+
+    if args.diff:
+        try:
+            diff_text = get_git_diff(args.diff, args.git_repo, args.context, args.files)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+        hunks = [(file_diff, hunk) for file_diff in parse_unified_diff(diff_text) for hunk in file_diff.hunks]
+        if not hunks:
+            print(f"No reviewable changes in {args.diff}")
+            return 0
+        failures = []
+        if args.stream:
+            stream = lambda item: stream_hunk(item[0], item[1], options)
+            for (file_diff, hunk), pieces in run_streaming(hunks, stream, jobs=args.jobs):
+                print(f"\n🔍 Reviewing: {file_diff.path} (lines {hunk.new_start}-{hunk.new_end})")
+                error = print_stream(pieces, f"{file_diff.path}:{hunk.new_start}")
+                if error:
+                    failures.append(error)
+            return report_failures(failures, len(hunks))
+
+        def review(item):
+            try:
+                return analyze_hunk(item[0], item[1], options), None
+            except Exception as e:
+                return f"❌ LLM error for {item[0].path}:{item[1].new_start}: {e}", f"{item[0].path}:{item[1].new_start}: {e}"
+
+        for (file_diff, hunk), (feedback, error) in run_reviews(hunks, review, jobs=args.jobs):
+            print(f"\n🔍 Reviewing: {file_diff.path} (lines {hunk.new_start}-{hunk.new_end})")
+            print(feedback)
+            if error:
+                failures.append(error)
+        return report_failures(failures, len(hunks))
+
+    failures = []
+    total = 0
+    if args.stream:
+        for file_path, pieces in run_streaming(paths, lambda path: stream_file(path, options), jobs=args.jobs):
+            print(f"\n🔍 Reviewing: {file_path}")
+            total += 1
+            error = print_stream(pieces, file_path)
+            if error:
+                failures.append(error)
+        return report_failures(failures, total)
+
+    progress = StateDiff()
+    seen = []
+    reused = 0
+    for file_review in review_files(paths, options):
+        print(f"\n🔍 Reviewing: {file_review.path}")
+        print(file_review.report())
+        total += 1
+        seen.append(file_review.path)
+        reused += file_review.unchanged
+        if file_review.failure:
+            failures.append(file_review.failure)
+        diff = record_state(file_review, file_review.all_findings(), options)
+        if diff:
+            progress.add(diff)
+            print(format_state_diff(diff))
+    if args.repo and not total:
+        print(f"No reviewable files under {args.repo}")
+    if options.state:
+        if args.repo:
+            gone = options.state.prune(seen, args.repo)
+            progress.add(gone)
+            if gone.resolved:
+                print(f"\n{format_state_diff(gone)}")
+        print(f"\n📊 {progress.summary()}; {reused} of {total} files unchanged and not re-sent")
+    return report_failures(failures, total)
+
+def review_structured(args, options: ReviewOptions, paths) -> int:
+    """Emit machine-readable findings on stdout; progress and errors go to stderr."""
+    writer = FindingsWriter(args.format)
+    failures = []
+    total = 0
+    if args.diff:
+        try:
+            diff_text = get_git_diff(args.diff, args.git_repo, args.context, args.files)
+        except RuntimeError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        hunks = [(file_diff, hunk) for file_diff in parse_unified_diff(diff_text) for hunk in file_diff.hunks]
+
+        def review(item):
+            try:
+                return hunk_findings(item[0], item[1], options), None
+            except Exception as e:
+                return [], f"{item[0].path}:{item[1].new_start}: {e}"
+
+        for _, (found, error) in run_reviews(hunks, review, jobs=args.jobs):
+            total += 1
+            writer.write(found)
+            if error:
+                failures.append(error)
+    else:
+        progress = StateDiff()
+        seen = []
+        reused = 0
+        for file_review in review_files(paths, options):
+            total += 1
+            seen.append(file_review.path)
+            if file_review.error:
+                print(file_review.error, file=sys.stderr)
+                continue
+            reused += file_review.unchanged
+            found = file_review.all_findings()
+            diff = record_state(file_review, found, options)
+            if diff:
+                progress.add(diff)
+                found += diff.resolved
+            writer.write(found)
+            if file_review.failure:
+                failures.append(file_review.failure)
+        if options.state:
+            if args.repo:
+                gone = options.state.prune(seen, args.repo)
+                for finding in gone.resolved:
+                    finding.baseline = "resolved"
+                progress.add(gone)
+                writer.write(gone.resolved)
+            print(f"📊 {progress.summary()}; {reused} of {total} files unchanged and not re-sent", file=sys.stderr)
+    writer.close()
+    return report_failures(failures, total, out=sys.stderr)
+
+def review_remote(args, paths) -> int:
+    """Send the selected files or diff to a review server and print its results like a local run."""
+    from review_client import ServerError, stream_review, submit_review
+
+    log = sys.stderr if args.format != "text" else sys.stdout
+    payload = {"format": "text" if args.format == "text" else "json", "refresh": args.refresh}
+    if args.diff:
+        try:
+            payload["diff"] = get_git_diff(args.diff, args.git_repo, args.context, args.files)
+        except RuntimeError as e:
+            print(f"❌ {e}", file=log)
+            return 1
+    else:
+        payload["files"] = []
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    payload["files"].append({"path": path, "content": f.read()})
+            except Exception as e:
+                print(f"❌ Error reading file `{path}`: {e}", file=log)
+
+    writer = FindingsWriter(args.format) if args.format != "text" else None
+    try:
+        job = submit_review(args.server, payload, args.timeout)
+        for event in stream_review(args.server, job["id"], args.timeout):
+            if event["event"] == "result" and writer:
+                writer.write([Finding.from_dict(finding) for finding in event.get("findings", [])])
+                if "error" in event:
+                    print(f"❌ LLM error for {event['error']}", file=log)
+            elif event["event"] == "result":
+                lines = f" (lines {event['lines'][0]}-{event['lines'][1]})" if "lines" in event else ""
+                print(f"\n🔍 Reviewing: {event['path']}{lines}")
+                print(event["report"] if "report" in event else f"❌ LLM error for {event['error']}")
+            elif event["event"] == "done":
+                if event["error"]:
+                    print(f"❌ Review server job failed: {event['error']}", file=log)
+                    return 1
+                if writer:
+                    writer.close()
+                return report_failures(event["failures"], event["total"], out=log)
+    except (ServerError, OSError) as e:
+        print(f"❌ Review server {args.server}: {e}", file=log)
+        return 1
+    print(f"❌ Review server {args.server} closed the stream early", file=log)
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
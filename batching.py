@@ -0,0 +1,86 @@
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+FILE_HEADER_RE = re.compile(r"^\s*#{1,6}\s*FILE:\s*`?(.+?)`?\s*$", re.MULTILINE)
+DEFAULT_BATCH_TOKENS = 3000  # budget for one packed multi-file prompt
+DEFAULT_SMALL_FILE_TOKENS = 600  # files at or below this size are eligible for packing
+DEFAULT_WINDOW = 64  # how many files a batch may wait for before it is sent anyway
+
+
+def iter_batches(items: Iterable[T], cost: Callable[[T], Optional[int]], max_tokens: int = DEFAULT_BATCH_TOKENS,
+                 small_tokens: int = DEFAULT_SMALL_FILE_TOKENS, window: int = DEFAULT_WINDOW) -> Iterator[List[T]]:
+    """Group a stream of items into work units.
+
+    Items whose `cost` is None (nothing to send) or above `small_tokens` are yielded
+    alone; small items are packed first-fit into batches of at most `max_tokens`.
+    A batch is flushed when full, when `window` items have passed since it opened,
+    or at the end of the stream, so a lazy input never stalls.
+    """
+    pending = []
+    pending_tokens = 0
+    opened_at = 0
+
+    for position, item in enumerate(items):
+        tokens = cost(item)
+        if tokens is None or tokens > small_tokens:
+            yield [item]
+        else:
+            if pending and pending_tokens + tokens > max_tokens:
+                yield pending
+                pending, pending_tokens = [], 0
+            if not pending:
+                opened_at = position
+            pending.append(item)
+            pending_tokens += tokens
+
+        if pending and position - opened_at >= window:
+            yield pending
+            pending, pending_tokens = [], 0
+
+    if pending:
+        yield pending
+
+
+def get_file_section(code: str, filename: str, file_type: str, context: str = "") -> str:
+    context = f"{context}\n\nCode:\n" if context else ""
+    return f"=== FILE: {filename} ({file_type}) ===\n{context}{code}\n=== END FILE: {filename} ===\n"
+
+
+def get_batch_prompt(sections: List[str], response_format: str = None) -> str:
+    response_format = response_format or """Under each header, give clear bullet-point feedback with explanations for that file only.
+If a file has no issues, write `- No issues found.` under its header."""
+    return f"""
+You are a senior software reviewer. Review each of the following {len(sections)} code files separately.
+
+For every file, identify and comment on:
+- Poor variable/function naming with better suggestions
+- Syntax or logical errors
+- Redundant or unreachable code
+- Performance or optimization opportunities
+- Missing edge-case or error handling
+- Security and style violations
+
+Format: start the feedback for each file with a line `### FILE: <filename>` using the filename
+exactly as given, and cover every file, in order.
+{response_format}
+
+{"".join(sections)}"""
+
+
+def split_batch_response(response: str, filenames: List[str]) -> Dict[str, str]:
+    """Split a packed review back into per-file sections; files the model skipped are omitted."""
+    headers = list(FILE_HEADER_RE.finditer(response))
+    reviews = {}
+    for i, match in enumerate(headers):
+        name = match.group(1).strip()
+        # Tolerate the model echoing the "(SQL)" type suffix from the section header
+        name = re.sub(r"\s*\([\w#+ ]+\)$", "", name)
+        if name not in filenames:
+            continue
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(response)
+        body = response[match.end():end].strip()
+        if body:
+            reviews[name] = body
+    return reviews
@@ -0,0 +1,387 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from ai_reviewer import ReviewOptions, review_files
+from chunker import count_tokens
+from compaction import compact_code
+from llm_backend import MODEL, TEMPERATURE, BackendError, LLMBackend, OpenAIBackend, find_env_file, set_backend
+from rate_limit import RateLimitedBackend
+
+DEFAULT_FILE_COUNTS = "1,100,1000"
+DEFAULT_MIN_BYTES = 100
+DEFAULT_MAX_BYTES = 20_000
+DEFAULT_STARTUP_BUDGET_MS = 100  # median wall time allowed for `--help` and a fully cached run
+STARTUP_RUNS = 15
+STARTUP_FILES = 5
+# Only needed once a request is sent (or with opt-in flags); importing any of them on the fast path is a regression
+DEFERRED_MODULES = ("dotenv", "openai", "http.client", "ssl", "tiktoken", "sqlite3")
+
+LICENSE_HEADER = """{c} Copyright (c) Example Corp. All rights reserved.
+{c} Licensed under the Apache License, Version 2.0 (the "License");
+{c} you may not use this file except in compliance with the License.
+{c} Unless required by applicable law or agreed to in writing, software
+{c} distributed under the License is distributed on an "AS IS" BASIS.
+
+"""
+SQL_SNIPPET = """-- load step {n}
+-- Loads the orders for one day into staging.
+-- The upstream feed is append-only, so rows are never updated in raw.
+-- Amounts are in cents; conversion happens in the mart layer.
+-- Owner: data platform team
+CREATE OR REPLACE TABLE staging.orders_{n} AS
+SELECT order_id, customer_id, amount, created_at
+FROM raw.orders
+WHERE created_at >= DATEADD(day, -{n}, CURRENT_DATE);
+
+UPDATE staging.orders_{n} SET amount = amount * 1.{n} WHERE amount > {n};
+
+"""
+PY_SNIPPET = """def load_batch_{n}(cursor, rows):
+    \"\"\"Insert one batch of rows.\"\"\"
+    for row in rows:
+        try:
+            cursor.execute(f"INSERT INTO events_{n} VALUES ('{{row['id']}}', {{row['value']}})")
+        except Exception as e:
+            print(e)
+    return len(rows)
+
+
+SAMPLE_{n} = [
+    ("2024-01-01", "north", 120, 0.5),
+    ("2024-01-02", "south", 80, 0.25),
+    ("2024-01-03", "east", 95, 0.75),
+    ("2024-01-04", "west", 110, 0.5),
+    ("2024-01-05", "north", 130, 0.25),
+    ("2024-01-06", "south", 70, 0.5),
+    ("2024-01-07", "east", 105, 0.75),
+    ("2024-01-08", "west", 90, 0.25),
+    ("2024-01-09", "north", 125, 0.5),
+    ("2024-01-10", "south", 85, 0.75),
+]
+
+
+"""
+
+
+class CountingBackend(LLMBackend):
+    """Pass-through backend that records per-request latency and token counts."""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.latencies = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def complete(self, messages, model: str = MODEL, temperature: float = TEMPERATURE,
+                 timeout: float = None) -> str:
+        started = time.perf_counter()
+        try:
+            content = self.backend.complete(messages, model, temperature, timeout)
+        except BackendError:
+            with self._lock:
+                self.errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        completion_tokens = count_tokens(content)
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        return content
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def generate_corpus(directory: str, count: int, min_bytes: int, max_bytes: int, seed: int = 0) -> List[str]:
+    """Write `count` SQL/Python files with log-uniformly distributed sizes; return their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        size = int(math.exp(rng.uniform(math.log(min_bytes), math.log(max_bytes))))
+        extension, snippet = (".sql", SQL_SNIPPET) if i % 2 else (".py", PY_SNIPPET)
+        parts = [LICENSE_HEADER.format(c="--" if i % 2 else "#")]
+        length = len(parts[0])
+        n = 0
+        while length < size:
+            # Vary the content per file so every file is a distinct review (no cache or dedup hits)
+            part = snippet.format(n=f"{i}_{n}")
+            parts.append(part)
+            length += len(part)
+            n += 1
+        text = "".join(parts)[:size]
+        text = text[:text.rfind("\n") + 1] or text
+        path = os.path.join(directory, f"f{i:06d}{extension}")
+        with open(path, "w") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def start_mock_server(args) -> subprocess.Popen:
+    """Run mock_llm_server.py in a child process so its CPU and memory are not measured."""
+    command = [sys.executable, "-u", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm_server.py"),
+               "--port", "0", "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--tokens-per-second", str(args.tokens_per_second), "--error-rate", str(args.error_rate),
+               "--seed", str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    match = re.search(r"(http://\S+)", line)
+    if not match:
+        server.kill()
+        raise RuntimeError(f"mock server did not start: {line!r}")
+    server.base_url = match.group(1)
+    return server
+
+
+def run_scenario(paths: List[str], base_url: str, args) -> Dict:
+    counting = CountingBackend(OpenAIBackend(base_url=base_url, timeout=args.timeout))
+    set_backend(RateLimitedBackend(counting, args.rpm or None, args.tpm or None,
+                                   max_retries=args.max_retries, base_delay=args.base_delay))
+    options = ReviewOptions(timeout=args.timeout, cache=None, jobs=args.jobs, batch_tokens=args.batch_tokens,
+                            structured=args.structured, compact=args.compact)
+
+    failures = 0
+    first_result = None
+    started = time.perf_counter()
+    for file_review in review_files(paths, options):
+        if first_result is None:
+            first_result = time.perf_counter() - started
+        failures += bool(file_review.failure)
+    elapsed = time.perf_counter() - started
+    counting.close()
+
+    source_tokens = compacted_tokens = 0
+    if args.compact:
+        for path in paths:
+            with open(path) as f:
+                code = f.read()
+            source_tokens += count_tokens(code)
+            compacted_tokens += count_tokens(compact_code(code, path).text)
+
+    return {
+        "files": len(paths),
+        "bytes": sum(os.path.getsize(p) for p in paths),
+        "seconds": round(elapsed, 4),
+        "files_per_sec": round(len(paths) / elapsed, 2) if elapsed else None,
+        "first_result_seconds": round(first_result or 0.0, 4),
+        "requests": len(counting.latencies),
+        "request_errors": counting.errors,
+        "failed_files": failures,
+        "latency_ms": {f"p{p}": round(percentile(counting.latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        "prompt_tokens": counting.prompt_tokens,
+        "completion_tokens": counting.completion_tokens,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **({"compaction": {
+            "source_tokens": source_tokens,
+            "compacted_tokens": compacted_tokens,
+            "saved_pct": round(100 * (1 - compacted_tokens / source_tokens), 1) if source_tokens else 0.0
+        }} if args.compact else {})
+    }
+
+
+def run_isolated(paths: List[str], base_url: str, args) -> Dict:
+    """Run a scenario in a fresh interpreter: ru_maxrss only ever grows, so scenarios sharing one
+    process would each report the highest peak of any run before them."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_scenario, (paths, base_url, args))
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, int], int]:
+    """Cumulative import time in microseconds per module, and the total over top-level imports,
+    from `python -X importtime` output (nested imports are indented under their importer)."""
+    times, total = {}, 0
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+            if not parts[2].startswith("  "):
+                total += int(parts[1])
+    return times, total
+
+
+def run_startup(args, corpus_root: str) -> Dict:
+    """Time CLI start-up in fresh interpreters: `--help`, and a review where every file is already cached."""
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_reviewer.py")
+    directory = os.path.join(corpus_root, "startup")
+    os.makedirs(directory, exist_ok=True)
+    paths = generate_corpus(directory, STARTUP_FILES, args.min_bytes, args.max_bytes, args.seed)
+    env = dict(os.environ, AI_REVIEWER_BACKEND="mock", AI_REVIEWER_CACHE_DIR=os.path.join(corpus_root, "cache"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure with bytecode cached, as an installed tool runs
+    subprocess.run([sys.executable, cli] + paths, env=env, stdout=subprocess.DEVNULL, check=True)  # fill the cache
+
+    # Settings in a .env file have to be read before the cache key is known, so it costs python-dotenv
+    deferred = [module for module in DEFERRED_MODULES if module != "dotenv" or not find_env_file()]
+    results = {}
+    for name, command in (("help", [cli, "--help"]), ("cached", [cli] + paths)):
+        wall = []
+        for _ in range(STARTUP_RUNS):
+            started = time.perf_counter()
+            subprocess.run([sys.executable] + command, env=env, stdout=subprocess.DEVNULL, check=True)
+            wall.append(time.perf_counter() - started)
+        traced = subprocess.run([sys.executable, "-X", "importtime"] + command, env=env, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True, check=True)
+        imports, total = parse_importtime(traced.stderr)
+        slowest = sorted(imports.items(), key=lambda item: -item[1])[:8]
+        results[name] = {
+            "wall_ms": {f"p{p}": round(percentile(wall, p) * 1000, 1) for p in (50, 95)},
+            "import_ms": round(total / 1000, 1),
+            "slowest_imports_ms": {module: round(us / 1000, 1) for module, us in slowest},
+            "deferred_imported": [module for module in deferred if module in imports]
+        }
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: Dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {s["files"]: s for s in json.load(f)["scenarios"]}
+    print(f"\nvs {baseline_path}:")
+    for scenario in results["scenarios"]:
+        old = baseline.get(scenario["files"])
+        if not old:
+            continue
+        speedup = scenario["files_per_sec"] / old["files_per_sec"] if old["files_per_sec"] else float("nan")
+        tokens = scenario["prompt_tokens"] / old["prompt_tokens"] if old["prompt_tokens"] else float("nan")
+        print(f"  {scenario['files']:>6} files: {speedup:.2f}x files/sec, {tokens:.2f}x prompt tokens, "
+              f"p95 {old['latency_ms']['p95']} -> {scenario['latency_ms']['p95']} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the review pipeline against a local mock LLM server")
+    parser.add_argument("--files", default=DEFAULT_FILE_COUNTS,
+                        help=f"comma-separated corpus sizes, one scenario each (default: {DEFAULT_FILE_COUNTS})")
+    parser.add_argument("--min-bytes", type=int, default=DEFAULT_MIN_BYTES)
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help=f"file sizes are log-uniform between --min-bytes and this (default: {DEFAULT_MAX_BYTES})")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock time to first token, seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="mock generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-j", "--jobs", type=int, default=8)
+    parser.add_argument("--batch-tokens", type=int, default=3000)
+    parser.add_argument("--structured", action="store_true", help="request JSON findings, as --format jsonl does")
+    parser.add_argument("--compact", action="store_true", help="compact prompts, as the CLI's --compact does")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--rpm", type=float, default=0)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--base-delay", type=float, default=0.1, help="retry backoff base, seconds")
+    parser.add_argument("--corpus-dir", help="where to generate files (default: a temporary directory)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="RESULTS.json", help="print the change against an earlier run")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure CLI start-up instead (--help and a fully cached run) and exit 1 if it is over "
+                             "--startup-budget or imports a module that should load lazily")
+    parser.add_argument("--startup-budget", type=float, default=DEFAULT_STARTUP_BUDGET_MS, metavar="MS",
+                        help=f"median start-up time allowed, in milliseconds (default: {DEFAULT_STARTUP_BUDGET_MS})")
+    args = parser.parse_args(argv)
+
+    corpus_root = args.corpus_dir or tempfile.mkdtemp(prefix="ai_reviewer_bench_")
+    if args.startup:
+        try:
+            return startup_main(args, corpus_root)
+        finally:
+            if not args.corpus_dir:
+                shutil.rmtree(corpus_root, ignore_errors=True)
+
+    server = start_mock_server(args)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "corpus_dir")},
+        "scenarios": []
+    }
+    try:
+        for count in (int(c) for c in args.files.split(",")):
+            directory = os.path.join(corpus_root, f"n{count}")
+            os.makedirs(directory, exist_ok=True)
+            paths = generate_corpus(directory, count, args.min_bytes, args.max_bytes, args.seed)
+            scenario = run_isolated(paths, server.base_url, args)
+            results["scenarios"].append(scenario)
+            print(f"📏 {count:>6} files ({scenario['bytes'] / 1024:.0f} KB): {scenario['files_per_sec']} files/s, "
+                  f"first result {scenario['first_result_seconds']}s, p50/p95/p99 "
+                  f"{scenario['latency_ms']['p50']}/{scenario['latency_ms']['p95']}/{scenario['latency_ms']['p99']} ms, "
+                  f"{scenario['requests']} requests, {scenario['prompt_tokens']} prompt tokens, "
+                  f"peak RSS {scenario['peak_rss_mb']} MB", flush=True)
+            if "compaction" in scenario:
+                saved = scenario["compaction"]
+                print(f"   compaction: {saved['source_tokens']} -> {saved['compacted_tokens']} source tokens "
+                      f"(-{saved['saved_pct']}%)", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+def startup_main(args, corpus_root: str) -> int:
+    startup = run_startup(args, corpus_root)
+    failed = False
+    for name, result in startup.items():
+        median = result["wall_ms"]["p50"]
+        slowest = ", ".join(f"{module} {ms}" for module, ms in result["slowest_imports_ms"].items())
+        print(f"🚀 {name}: p50/p95 {median}/{result['wall_ms']['p95']} ms, imports {result['import_ms']} ms "
+              f"(slowest: {slowest})")
+        if median > args.startup_budget:
+            print(f"❌ {name} start-up is over the {args.startup_budget:g} ms budget")
+            failed = True
+        if result["deferred_imported"]:
+            print(f"❌ {name} imported {', '.join(result['deferred_imported'])}, which should only load when needed")
+            failed = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                       "python": platform.python_version(), "startup": startup}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
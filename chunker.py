@@ -0,0 +1,264 @@
+import ast
+import difflib
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Tuple
+
+from languages import detect_language
+
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+LINE_REF_RE = re.compile(r"\bL\d+\b")
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    """Load the tokenizer on first use: importing tiktoken and its tables costs more than a cached run."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # tiktoken is optional; fall back to a ~4 chars/token estimate
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Chunk:
+    start_line: int
+    end_line: int
+    text: str
+
+
+def split_python(code: str) -> List[Tuple[int, str]]:
+    """Split Python source at top-level statements, returning (start_line, text) segments."""
+    lines = code.splitlines(keepends=True)
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return split_blank_lines(code)
+
+    starts = []
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        starts.append(start)
+    if not starts:
+        return [(1, code)] if code.strip() else []
+
+    # Leading comments/imports before the first statement stay with it
+    starts[0] = 1
+    segments = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] - 1 if i + 1 < len(starts) else len(lines)
+        segments.append((start, "".join(lines[start - 1:end])))
+    return segments
+
+
+def split_sql(code: str) -> List[Tuple[int, str]]:
+    """Split SQL on `;` outside strings, quoted identifiers, comments and $$ bodies."""
+    segments = []
+    start = 0
+    start_line = 1
+    line = 1
+    i = 0
+    n = len(code)
+    while i < n:
+        ch = code[i]
+        if ch == "\n":
+            line += 1
+        elif ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if code[end] == ch:
+                    if end + 1 < n and code[end + 1] == ch:  # escaped '' or ""
+                        end += 2
+                        continue
+                    break
+                if code[end] == "\\" and ch == "'":
+                    end += 1
+                end += 1
+            line += code.count("\n", i, end + 1)
+            i = end
+        elif code.startswith("--", i):
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            line += code.count("\n", i, end)
+            i = end
+            continue
+        elif code.startswith("$$", i):
+            end = code.find("$$", i + 2)
+            end = n if end == -1 else end + 2
+            line += code.count("\n", i, end)
+            i = end
+            continue
+        elif ch == ";":
+            segments.append((start_line, code[start:i + 1]))
+            start = i + 1
+            # Whatever follows the `;` on this line belongs to the next segment
+            start_line = line
+        i += 1
+
+    if code[start:].strip():
+        segments.append((start_line, code[start:]))
+    return segments
+
+
+def split_blank_lines(code: str) -> List[Tuple[int, str]]:
+    """Fallback splitter: paragraphs separated by blank lines."""
+    segments = []
+    block = []
+    block_start = 1
+    for number, line in enumerate(code.splitlines(keepends=True), start=1):
+        if not block:
+            block_start = number
+        block.append(line)
+        if not line.strip():
+            segments.append((block_start, "".join(block)))
+            block = []
+    if block:
+        segments.append((block_start, "".join(block)))
+    return segments
+
+
+def split_code(code: str, filename: str) -> List[Tuple[int, str]]:
+    language = detect_language(filename, code[:100].encode("utf-8"))
+    if language == "SQL":
+        return split_sql(code)
+    if language == "Python":
+        return split_python(code)
+    return split_blank_lines(code)
+
+
+def _split_oversized(start_line: int, text: str, max_tokens: int) -> List[Tuple[int, str]]:
+    pieces = []
+    current = []
+    current_start = start_line
+    current_tokens = 0
+    for offset, line in enumerate(text.splitlines(keepends=True)):
+        tokens = count_tokens(line)
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append((current_start, "".join(current)))
+            current, current_tokens = [], 0
+            current_start = start_line + offset
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        pieces.append((current_start, "".join(current)))
+    return pieces
+
+
+def chunk_code(code: str, filename: str, max_tokens: int) -> List[Chunk]:
+    """Pack syntactic segments into chunks of at most `max_tokens` tokens each."""
+    segments = []
+    for start_line, text in split_code(code, filename):
+        if count_tokens(text) > max_tokens:
+            segments.extend(_split_oversized(start_line, text, max_tokens))
+        else:
+            segments.append((start_line, text))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for start_line, text in segments:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(_make_chunk(current))
+            current, current_tokens = [], 0
+        current.append((start_line, text))
+        current_tokens += tokens
+    if current:
+        chunks.append(_make_chunk(current))
+    return chunks
+
+
+def _make_chunk(segments: List[Tuple[int, str]]) -> Chunk:
+    text = "".join(t for _, t in segments)
+    start_line = segments[0][0]
+    # Skip leading blank lines so the reported range starts at real code
+    stripped = text.lstrip("\n")
+    start_line += text.count("\n", 0, len(text) - len(stripped))
+    end_line = start_line + max(stripped.rstrip("\n").count("\n"), 0)
+    return Chunk(start_line, end_line, stripped)
+
+
+def number_lines(text: str, start_line: int) -> str:
+    return "\n".join(f"{start_line + i:>5} | {line}" for i, line in enumerate(text.splitlines()))
+
+
+def get_chunk_prompt(chunk: Chunk, filename: str, file_type: str, index: int, total: int,
+                     response_format: str = None, context: str = "") -> str:
+    response_format = response_format or """Provide clear, bullet-point feedback with explanations. Start every bullet with the
+line number it refers to, written as `L<number>:`."""
+    context = f"{context}\n\n" if context else ""
+    return f"""
+You are a senior software reviewer. Analyze part {index} of {total} of a {file_type} code file.
+The other parts are reviewed separately, so do not comment on code that is not shown.
+
+Identify and comment on:
+- Poor variable/function naming with better suggestions
+- Syntax or logical errors
+- Redundant or unreachable code
+- Performance or optimization opportunities
+- Missing edge-case or error handling
+- Security and style violations
+
+{response_format}
+
+{context}Filename: {filename}
+Lines: {chunk.start_line}-{chunk.end_line}
+
+Code:
+{number_lines(chunk.text, chunk.start_line)}
+"""
+
+
+def split_findings(review: str) -> List[str]:
+    """Split a markdown review into top-level bullets, keeping their continuation lines."""
+    findings = []
+    for line in review.splitlines():
+        if BULLET_RE.match(line) and not line.startswith((" ", "\t")):
+            findings.append(line.rstrip())
+        elif findings and line.strip() and not line.lstrip().startswith("#"):
+            findings[-1] += "\n" + line.rstrip()
+    return findings
+
+
+def _finding_key(finding: str) -> str:
+    # Compare on the headline only, ignoring line numbers and punctuation
+    text = BULLET_RE.sub("", finding.splitlines()[0].lower(), count=1)
+    text = re.sub(r"\bl?\d+\b", "", text)
+    return re.sub(r"[^a-z]+", " ", text).strip()
+
+
+def merge_reviews(reviews: List[str], similarity: float = 0.9) -> str:
+    """Merge per-chunk reviews into one bullet list, folding duplicate findings together."""
+    merged = []
+    keys = []
+    also = []  # extra line references collected from dropped duplicates
+    for review in reviews:
+        for finding in split_findings(review):
+            key = _finding_key(finding)
+            match = next((i for i, k in enumerate(keys)
+                          if key == k or difflib.SequenceMatcher(None, key, k).ratio() >= similarity), None)
+            if match is None:
+                keys.append(key)
+                merged.append(finding)
+                also.append([])
+                continue
+            known = LINE_REF_RE.findall(merged[match]) + also[match]
+            also[match] += [ref for ref in LINE_REF_RE.findall(finding.splitlines()[0]) if ref not in known]
+
+    for i, refs in enumerate(also):
+        if refs:
+            head, _, rest = merged[i].partition("\n")
+            merged[i] = f"{head} (also {', '.join(refs)})" + ("\n" + rest if rest else "")
+    return "\n".join(merged)
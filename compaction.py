@@ -0,0 +1,129 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+from findings import parse_findings
+from languages import detect_language
+
+DEFAULT_MAX_COMMENT_LINES = 4  # longer comment runs keep their first lines only
+DEFAULT_MAX_LITERAL_LINES = 8  # longer runs of pure data lines are truncated
+DEFAULT_MAX_LINE_CHARS = 400
+
+COMMENT_PREFIXES = {"Python": "#", "Shell": "#", "Ruby": "#", "SQL": "--"}
+LICENSE_RE = re.compile(r"licen[cs]e|copyright|spdx|all rights reserved", re.IGNORECASE)
+STRING_RE = re.compile(r"""[rbuf]*(?:'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")""", re.IGNORECASE)
+NUMBER_RE = re.compile(r"(?<![\w.])-?\d[\d_]*(?:\.\d*)?(?:[eE][-+]?\d+)?\b|\b(?:True|False|None|NULL|null|true|false)\b")
+LINE_REF_RE = re.compile(r"\bL(\d+)(?:(\s*-\s*L?)(\d+))?\b")
+
+
+@dataclass
+class Compaction:
+    """Compacted source plus, for every compacted line, the original line it came from."""
+    text: str
+    line_map: List[int] = field(default_factory=list)
+    original_lines: int = 0
+
+    def to_original(self, line: int) -> int:
+        if not self.line_map:
+            return line
+        return self.line_map[min(max(line, 1), len(self.line_map)) - 1]
+
+
+def _is_data_line(line: str, comment: str) -> bool:
+    """True for lines made only of literals and punctuation, e.g. rows of a sample DataFrame."""
+    code = line.split(comment, 1)[0] if comment and comment not in STRING_RE.sub("", line) else line
+    stripped = NUMBER_RE.sub("N", STRING_RE.sub("S", code)).strip()
+    return bool(stripped) and ("S" in stripped or "N" in stripped) and not stripped.strip("SN[](){},: \t")
+
+
+def compact_code(code: str, filename: str, max_comment_lines: int = DEFAULT_MAX_COMMENT_LINES,
+                 max_literal_lines: int = DEFAULT_MAX_LITERAL_LINES,
+                 max_line_chars: int = DEFAULT_MAX_LINE_CHARS) -> Compaction:
+    """Shrink a file for review without changing the code a reviewer would comment on.
+
+    Drops a leading license header, shortens long comment blocks and runs of literal
+    data, collapses blank-line runs, truncates very long lines and removes common
+    indentation. Each omission leaves a one-line comment in place.
+    """
+    lines = code.splitlines()
+    comment = COMMENT_PREFIXES.get(detect_language(filename, code[:100].encode("utf-8")), "//")
+    kept = []  # (original line number, text)
+
+    def is_comment(text: str) -> bool:
+        return text.strip().startswith(comment)
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        if not line:
+            if kept and kept[-1][1]:
+                kept.append((i + 1, ""))
+            i += 1
+            continue
+
+        if is_comment(line) and not line.startswith("#!"):
+            end = i
+            while end < len(lines) and is_comment(lines[end]):
+                end += 1
+            block = lines[i:end]
+            indent = line[:len(line) - len(line.lstrip())]
+            if not kept and LICENSE_RE.search("\n".join(block)):
+                kept.append((i + 1, f"{comment} [license header: {len(block)} lines omitted]"))
+            elif len(block) > max_comment_lines:
+                keep = max(max_comment_lines // 2, 1)
+                kept += [(i + 1 + j, block[j].rstrip()) for j in range(keep)]
+                kept.append((i + 1 + keep, f"{indent}{comment} [... {len(block) - keep} more comment lines omitted]"))
+            else:
+                kept += [(i + 1 + j, text.rstrip()) for j, text in enumerate(block)]
+            i = end
+            continue
+
+        if _is_data_line(line, comment):
+            end = i
+            while end < len(lines) and lines[end].strip() and _is_data_line(lines[end], comment):
+                end += 1
+            if end - i > max_literal_lines:
+                head = max(max_literal_lines // 2, 1)
+                indent = line[:len(line) - len(line.lstrip())]
+                kept += [(i + 1 + j, lines[i + j].rstrip()) for j in range(head)]
+                kept.append((i + 1 + head, f"{indent}{comment} [... {end - i - head - 1} similar data lines omitted]"))
+                kept.append((end, lines[end - 1].rstrip()))
+                i = end
+                continue
+
+        if len(line) > max_line_chars:
+            line = f"{line[:max_line_chars]} {comment} [... {len(line) - max_line_chars} chars truncated]"
+        kept.append((i + 1, line))
+        i += 1
+
+    while kept and not kept[-1][1]:
+        kept.pop()
+    indents = [len(text) - len(text.lstrip()) for _, text in kept if text]
+    dedent = min(indents) if indents else 0
+    return Compaction(
+        "\n".join(text[dedent:] for _, text in kept),
+        [line_no for line_no, _ in kept],
+        len(lines)
+    )
+
+
+def remap_line_refs(review: str, compaction: Compaction) -> str:
+    """Rewrite `L<n>` / `L<a>-<b>` references from compacted to original line numbers."""
+    def to_original(match):
+        text = f"L{compaction.to_original(int(match.group(1)))}"
+        if match.group(3):
+            text += f"{match.group(2)}{compaction.to_original(int(match.group(3)))}"
+        return text
+    return LINE_REF_RE.sub(to_original, review)
+
+
+def remap_review(review: str, compaction: Compaction, filename: str, structured: bool) -> str:
+    """Translate a review of compacted code back to the original file's line numbers."""
+    if not structured:
+        return remap_line_refs(review, compaction)
+    findings = parse_findings(review, filename, 1, max(len(compaction.line_map), 1))
+    for finding in findings:
+        finding.line_start = compaction.to_original(finding.line_start)
+        finding.line_end = max(compaction.to_original(finding.line_end), finding.line_start)
+    return json.dumps([finding.to_dict() for finding in findings])
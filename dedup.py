@@ -0,0 +1,158 @@
+import difflib
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from chunker import count_tokens, split_findings
+from compaction import LINE_REF_RE
+from diff_review import Hunk, render_hunk
+
+DEFAULT_SIMILARITY = 0.8  # estimated Jaccard similarity above which a file is reviewed as a delta
+SHINGLE_TOKENS = 5
+SIGNATURE_SIZE = 64  # MinHash values per file
+BANDS = 16  # LSH bands; files sharing any band are compared (rows per band = SIGNATURE_SIZE // BANDS)
+MIN_SHINGLES = 20  # smaller files are only matched when identical
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_EMPTY = 1 << 64
+
+
+@dataclass
+class Sketch:
+    digest: str  # identical digests mean identical lines (ignoring trailing whitespace)
+    signature: Tuple[int, ...]
+    shingles: int
+
+
+@dataclass
+class DuplicateMatch:
+    key: Hashable
+    similarity: float
+    exact: bool
+
+
+def sketch(code: str) -> Sketch:
+    """Fingerprint code for duplicate detection with one-permutation MinHash over token shingles."""
+    normalized = "\n".join(line.rstrip() for line in code.splitlines()).rstrip("\n")
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    tokens = TOKEN_RE.findall(normalized)
+    count = max(len(tokens) - SHINGLE_TOKENS + 1, 1)
+    bins = [_EMPTY] * SIGNATURE_SIZE
+    for i in range(count):
+        shingle = " ".join(tokens[i:i + SHINGLE_TOKENS]).encode("utf-8")
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+        slot, rank = value % SIGNATURE_SIZE, value // SIGNATURE_SIZE
+        if rank < bins[slot]:
+            bins[slot] = rank
+    # Densify: an empty bin borrows the next filled one, so small files still compare bin by bin
+    filled = [i for i, value in enumerate(bins) if value != _EMPTY]
+    if filled:
+        for i in range(SIGNATURE_SIZE):
+            if bins[i] == _EMPTY:
+                bins[i] = bins[next((j for j in filled if j > i), filled[0])]
+    return Sketch(digest, tuple(bins), count)
+
+
+class DuplicateIndex:
+    """Online LSH index of representative files: find the closest earlier one, or add a new one."""
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY):
+        self.threshold = threshold
+        self.rows = SIGNATURE_SIZE // BANDS
+        self.exact: Dict[str, Hashable] = {}
+        self.buckets: List[Dict[Tuple[int, ...], List[Hashable]]] = [{} for _ in range(BANDS)]
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def find(self, fingerprint: Sketch) -> Optional[DuplicateMatch]:
+        with self._lock:
+            if fingerprint.digest in self.exact:
+                return DuplicateMatch(self.exact[fingerprint.digest], 1.0, True)
+            if fingerprint.shingles < MIN_SHINGLES:
+                return None
+            candidates = {key for band, rows in self._bands(fingerprint.signature)
+                          for key in self.buckets[band].get(rows, ())}
+            best = None
+            for key in candidates:
+                other = self.signatures[key]
+                similarity = sum(a == b for a, b in zip(fingerprint.signature, other)) / SIGNATURE_SIZE
+                if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                    best = DuplicateMatch(key, similarity, False)
+            return best
+
+    def add(self, key: Hashable, fingerprint: Sketch) -> None:
+        with self._lock:
+            self.exact.setdefault(fingerprint.digest, key)
+            if fingerprint.shingles < MIN_SHINGLES:
+                return
+            self.signatures[key] = fingerprint.signature
+            for band, rows in self._bands(fingerprint.signature):
+                self.buckets[band].setdefault(rows, []).append(key)
+
+
+def map_lines(old: str, new: str) -> Dict[int, int]:
+    """Old line number -> new line number for every line the edit left untouched."""
+    matcher = difflib.SequenceMatcher(None, old.splitlines(), new.splitlines(), autojunk=False)
+    mapping = {}
+    for tag, old_start, old_end, new_start, _ in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(old_end - old_start):
+                mapping[old_start + offset + 1] = new_start + offset + 1
+    return mapping
+
+
+def delta_diff(old: str, new: str, path: str, context: int = 3) -> str:
+    """A git-style unified diff turning `old` into `new`, for reviewing only what changed."""
+    lines = difflib.unified_diff(old.splitlines(), new.splitlines(), f"a/{path}", f"b/{path}", n=context,
+                                 lineterm="")
+    return f"diff --git a/{path} b/{path}\n" + "\n".join(lines)
+
+
+def pack_hunks(hunks: List[Hunk], max_tokens: int) -> List[Hunk]:
+    """Join consecutive hunks into as few as fit in `max_tokens`, so a near-copy with scattered
+    edits costs one request rather than one per hunk. Lines keep their own numbers, and a `⋮`
+    line marks each gap."""
+    packed = []
+    for hunk in hunks:
+        last = packed[-1] if packed else None
+        if last and count_tokens(render_hunk(last)) + count_tokens(render_hunk(hunk)) <= max_tokens:
+            last.lines = last.lines + [(" ", "⋮", None)] + hunk.lines
+            last.old_count = hunk.old_start + hunk.old_count - last.old_start
+            last.new_count = hunk.new_start + hunk.new_count - last.new_start
+        else:
+            packed.append(Hunk(hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count, hunk.section,
+                               list(hunk.lines)))
+    return packed
+
+
+def line_anchored(review: str) -> bool:
+    """Whether every bullet of a markdown review names the line it is about, so it can be remapped."""
+    findings = split_findings(review)
+    return bool(findings) and all(LINE_REF_RE.search(f.splitlines()[0]) for f in findings)
+
+
+def remap_bullets(review: str, line_map: Dict[int, int]) -> str:
+    """Carry a markdown review over to the edited file: renumber `L<n>` references and drop
+    bullets about lines that changed (those are reviewed again as part of the delta), as well as
+    bullets that do not say which line they are about."""
+    kept = []
+    for finding in split_findings(review):
+        head = LINE_REF_RE.search(finding.splitlines()[0])
+        if not head or int(head.group(1)) not in line_map:
+            continue
+
+        def renumber(match):
+            start = line_map.get(int(match.group(1)))
+            if start is None:
+                return match.group(0)
+            text = f"L{start}"
+            if match.group(3):
+                text += f"{match.group(2)}{line_map.get(int(match.group(3)), start)}"
+            return text
+        kept.append(LINE_REF_RE.sub(renumber, finding))
+    return "\n".join(kept)
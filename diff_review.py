@@ -0,0 +1,147 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+LINE_REF_RE = re.compile(r"\b(?:L|[Ll]ines? )(\d+)(?:\s*[-–]\s*L?(\d+))?")
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""
+    # (tag, text, new line number or None for removed lines); tag is "+", "-" or " "
+    lines: List[Tuple[str, str, Optional[int]]] = field(default_factory=list)
+
+    @property
+    def new_end(self) -> int:
+        return self.new_start + max(self.new_count, 1) - 1
+
+
+@dataclass
+class FileDiff:
+    path: str
+    old_path: Optional[str] = None
+    hunks: List[Hunk] = field(default_factory=list)
+    is_binary: bool = False
+
+
+def get_git_diff(rev_range: str, repo: str = ".", context: int = 3, paths: List[str] = None) -> str:
+    """Return the unified diff for `base..head` in a local git repository."""
+    import subprocess
+    cmd = ["git", "-C", repo, "diff", "--no-color", "--no-ext-diff", f"-U{context}", rev_range]
+    if paths:
+        cmd += ["--"] + list(paths)
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git diff {rev_range} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def parse_unified_diff(text: str) -> List[FileDiff]:
+    """Parse `git diff` output into files and hunks, tracking new-file line numbers."""
+    files = []
+    current = None
+    hunk = None
+    new_line = 0
+
+    for raw in text.splitlines():
+        if raw.startswith("diff --git "):
+            current = FileDiff(path="")
+            files.append(current)
+            hunk = None
+        elif current is None:
+            continue
+        elif hunk is None and raw.startswith("--- "):
+            old = raw[4:].strip()
+            current.old_path = None if old == "/dev/null" else old[2:] if old.startswith("a/") else old
+        elif hunk is None and raw.startswith("+++ "):
+            new = raw[4:].strip()
+            current.path = "" if new == "/dev/null" else new[2:] if new.startswith("b/") else new
+        elif raw.startswith("Binary files "):
+            current.is_binary = True
+        elif raw.startswith("@@"):
+            match = HUNK_HEADER_RE.match(raw)
+            if not match:
+                continue
+            old_start, old_count, new_start, new_count, section = match.groups()
+            hunk = Hunk(
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+                section=section.strip()
+            )
+            current.hunks.append(hunk)
+            new_line = hunk.new_start
+        elif hunk is not None and raw[:1] in ("+", "-", " "):
+            tag, body = raw[0], raw[1:]
+            if tag == "-":
+                hunk.lines.append((tag, body, None))
+            else:
+                hunk.lines.append((tag, body, new_line))
+                new_line += 1
+        elif hunk is not None and raw == "":
+            # Some tools strip the leading space from empty context lines
+            hunk.lines.append((" ", "", new_line))
+            new_line += 1
+
+    # Deleted files and binaries have nothing left to review
+    return [f for f in files if f.path and not f.is_binary and f.hunks]
+
+
+def render_hunk(hunk: Hunk) -> str:
+    """Render a hunk with new-file line numbers in the gutter so the model can cite them."""
+    rendered = []
+    for tag, body, line_no in hunk.lines:
+        gutter = f"{line_no:>5}" if line_no is not None else " " * 5
+        rendered.append(f"{gutter} {tag} {body}")
+    return "\n".join(rendered)
+
+
+def get_hunk_prompt(file_diff: FileDiff, hunk: Hunk, file_type: str, response_format: str = None) -> str:
+    header = f" (in `{hunk.section}`)" if hunk.section else ""
+    response_format = response_format or """Provide clear, bullet-point feedback with explanations. Start every bullet with the
+line number it refers to, written as `L<number>:` (for example `- L42: ...`)."""
+    return f"""
+You are a senior software reviewer. Review this change to a {file_type} file{header}.
+
+Lines starting with `+` were added, `-` were removed, and the rest is unchanged context.
+The number on the left is the line number in the new version of the file.
+Only comment on the added or removed lines; use the context to understand them.
+
+Identify and comment on:
+- Poor variable/function naming with better suggestions
+- Syntax or logical errors
+- Redundant or unreachable code
+- Performance or optimization opportunities
+- Missing edge-case or error handling
+- Security and style violations
+
+{response_format}
+
+Filename: {file_diff.path}
+Lines: {hunk.new_start}-{hunk.new_end}
+
+Change:
+{render_hunk(hunk)}
+"""
+
+
+def map_findings(review: str, file_diff: FileDiff, hunk: Hunk) -> str:
+    """Rewrite `L<n>` references in a hunk review as `path:line` locations."""
+    valid_lines = {line_no for _, _, line_no in hunk.lines if line_no is not None}
+
+    def to_location(match):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else None
+        if start not in valid_lines:
+            return match.group(0)
+        if end and end in valid_lines and end > start:
+            return f"{file_diff.path}:{start}-{end}"
+        return f"{file_diff.path}:{start}"
+
+    return "\n".join(LINE_REF_RE.sub(to_location, line) for line in review.splitlines())
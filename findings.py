@@ -0,0 +1,182 @@
+import json
+import re
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Iterable, List
+
+SEVERITIES = ("info", "low", "medium", "high")
+SEVERITY_ALIASES = {
+    "critical": "high", "error": "high", "major": "high",
+    "warning": "medium", "warn": "medium", "moderate": "medium",
+    "minor": "low", "style": "low", "note": "info", "suggestion": "info",
+}
+SARIF_LEVELS = {"high": "error", "medium": "warning", "low": "note", "info": "note"}
+SARIF_BASELINE = {"new": "new", "unchanged": "unchanged", "resolved": "absent"}
+SCHEMA_VERSION = 1
+
+JSON_FORMAT = """Report the findings as a JSON array, with no prose or markdown fences around it.
+Each finding is an object:
+{"line_start": <int>, "line_end": <int>, "severity": "info" | "low" | "medium" | "high",
+ "category": "<short kebab-case issue type>", "message": "<what is wrong and why>",
+ "suggestion": "<concrete fix>"}
+Use the line numbers shown next to the code. Write [] if there is nothing to report."""
+
+LINE_REF_RE = re.compile(r"\bL(\d+)(?:\s*-\s*L?(\d+))?")
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+@dataclass
+class Finding:
+    """One review comment tied to a file and line range."""
+    file: str
+    line_start: int
+    line_end: int
+    severity: str
+    category: str
+    message: str
+    suggestion: str = ""
+    source: str = "llm"
+    baseline: str = None  # new / unchanged / resolved, when compared with a previous run
+
+    def to_markdown(self) -> str:
+        lines = f"L{self.line_start}" if self.line_end <= self.line_start else f"L{self.line_start}-{self.line_end}"
+        text = f"- {lines}: [{self.severity}] {self.message}"
+        if self.suggestion:
+            text += f" Suggestion: {self.suggestion}"
+        return text
+
+    def to_dict(self) -> Dict:
+        data = {"schema_version": SCHEMA_VERSION, **asdict(self)}
+        if self.baseline is None:
+            del data["baseline"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Finding":
+        """Inverse of to_dict; unknown keys (e.g. schema_version) are ignored."""
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+def _extract_json(text: str):
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Models sometimes wrap the array in prose; take the outermost [...] block
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+    return None
+
+
+def _as_int(value, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        match = re.search(r"\d+", str(value or ""))
+        return int(match.group()) if match else default
+
+
+def validate_finding(item: Dict, file: str, first_line: int = 1, last_line: int = None) -> Finding:
+    """Coerce one raw JSON object into a Finding; raise ValueError if it has no message."""
+    if not isinstance(item, dict):
+        raise ValueError("finding is not an object")
+    message = str(item.get("message") or "").strip()
+    if not message:
+        raise ValueError("finding has no message")
+
+    line_start = _as_int(item.get("line_start", item.get("line")), first_line)
+    line_end = _as_int(item.get("line_end"), line_start)
+    if last_line is not None:
+        line_start = min(max(line_start, first_line), last_line)
+        line_end = min(max(line_end, line_start), last_line)
+    line_end = max(line_end, line_start)
+
+    severity = str(item.get("severity") or "medium").strip().lower()
+    severity = SEVERITY_ALIASES.get(severity, severity)
+    if severity not in SEVERITIES:
+        severity = "medium"
+    category = re.sub(r"[^a-z0-9]+", "-", str(item.get("category") or "general").lower()).strip("-") or "general"
+    return Finding(file, line_start, line_end, severity, category, message,
+                   str(item.get("suggestion") or "").strip())
+
+
+def parse_findings(text: str, file: str, first_line: int = 1, last_line: int = None) -> List[Finding]:
+    """Parse and validate the model's JSON findings, falling back to markdown bullets."""
+    data = _extract_json(text)
+    if isinstance(data, dict):
+        data = data.get("findings", [data])
+    if not isinstance(data, list):
+        return findings_from_markdown(text, file, first_line, last_line)
+
+    findings = []
+    for item in data:
+        try:
+            findings.append(validate_finding(item, file, first_line, last_line))
+        except ValueError:
+            continue
+    return findings
+
+
+def findings_from_markdown(text: str, file: str, first_line: int = 1, last_line: int = None) -> List[Finding]:
+    """Best-effort conversion of a free-form bullet review into findings."""
+    findings = []
+    for line in text.splitlines():
+        if not BULLET_RE.match(line) or line.startswith((" ", "\t")):
+            continue
+        body = BULLET_RE.sub("", line, count=1).strip()
+        match = LINE_REF_RE.search(body)
+        item = {"message": LINE_REF_RE.sub("", body, count=1).lstrip(" :—-") if match else body,
+                "severity": "info", "category": "general"}
+        if match:
+            item["line_start"] = match.group(1)
+            item["line_end"] = match.group(2) or match.group(1)
+        try:
+            findings.append(validate_finding(item, file, first_line, last_line))
+        except ValueError:
+            continue
+    return findings
+
+
+def dedupe_findings(findings: Iterable[Finding]) -> List[Finding]:
+    seen = set()
+    unique = []
+    for finding in findings:
+        key = (finding.file, finding.line_start, finding.category,
+               re.sub(r"[^a-z]+", " ", finding.message.lower()).strip())
+        if key not in seen:
+            seen.add(key)
+            unique.append(finding)
+    return unique
+
+
+def to_sarif(findings: Iterable[Finding], tool_name: str = "ai-reviewer", tool_version: str = "") -> Dict:
+    """Build a SARIF 2.1.0 log with one result per finding."""
+    findings = list(findings)
+    rules = sorted({f.category for f in findings})
+    return {
+        "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {
+                "name": tool_name,
+                **({"version": tool_version} if tool_version else {}),
+                "rules": [{"id": rule, "name": rule} for rule in rules]
+            }},
+            "results": [{
+                "ruleId": f.category,
+                "ruleIndex": rules.index(f.category),
+                "level": SARIF_LEVELS[f.severity],
+                "message": {"text": f.message + (f" Suggestion: {f.suggestion}" if f.suggestion else "")},
+                "locations": [{"physicalLocation": {
+                    "artifactLocation": {"uri": f.file},
+                    "region": {"startLine": f.line_start, "endLine": f.line_end}
+                }}],
+                "properties": {"severity": f.severity, "source": f.source},
+                **({"baselineState": SARIF_BASELINE[f.baseline]} if f.baseline else {})
+            } for f in findings]
+        }]
+    }
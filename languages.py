@@ -0,0 +1,39 @@
+import os
+import re
+from typing import Optional
+
+# Extension -> language name used in prompts and to pick chunkers/static rules
+EXTENSIONS = {
+    ".sql": "SQL", ".ddl": "SQL", ".dml": "SQL",
+    ".py": "Python", ".pyw": "Python", ".pyi": "Python",
+    ".sh": "Shell", ".bash": "Shell",
+    ".js": "JavaScript", ".jsx": "JavaScript", ".mjs": "JavaScript", ".cjs": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript",
+    ".java": "Java", ".scala": "Scala", ".kt": "Kotlin",
+    ".go": "Go", ".rs": "Rust", ".rb": "Ruby", ".php": "PHP", ".cs": "C#",
+    ".c": "C", ".h": "C", ".cc": "C++", ".cpp": "C++", ".hpp": "C++",
+}
+LANGUAGES = sorted(set(EXTENSIONS.values()))
+SHEBANG_RE = re.compile(rb"^#!\s*\S*?(?:/env\s+)?(?:\S*/)?(python|bash|sh|node)[\d.]*\b")
+SHEBANG_LANGUAGES = {b"python": "Python", b"bash": "Shell", b"sh": "Shell", b"node": "JavaScript"}
+
+
+def detect_language(filename: str, head: bytes = None) -> Optional[str]:
+    """Language of a file from its extension, or from a `#!` line in `head` for extensionless scripts."""
+    language = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    if language or not head:
+        return language
+    match = SHEBANG_RE.match(head)
+    return SHEBANG_LANGUAGES[match.group(1)] if match else None
+
+
+def parse_languages(spec: str):
+    """Turn a comma-separated list such as "sql,python" into language names; "all" gives None."""
+    if spec.strip().lower() == "all":
+        return None
+    by_name = {language.lower(): language for language in LANGUAGES}
+    names = [name.strip().lower() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f"unknown language(s): {', '.join(unknown)} (choose from {', '.join(LANGUAGES)} or all)")
+    return {by_name[name] for name in names}
@@ -0,0 +1,378 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+
+def find_env_file() -> Optional[str]:
+    """The .env file python-dotenv would pick: the nearest one at or above this module's directory."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def load_env() -> None:
+    """Read .env into the environment without overriding variables that are already set.
+
+    python-dotenv is only imported when there is a file to read, so runs configured through
+    the environment alone do not pay for it at start-up."""
+    path = find_env_file()
+    if path:
+        from dotenv import load_dotenv
+        load_dotenv(path)
+
+
+load_env()  # before any of the settings below are read
+
+MODEL = os.getenv("AI_REVIEWER_MODEL", "gpt-4")
+TEMPERATURE = float(os.getenv("AI_REVIEWER_TEMPERATURE", "0.2"))
+SYSTEM_PROMPT = "You are a professional code reviewer."
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_POOL_SIZE = 16
+
+Messages = List[Dict[str, str]]
+
+
+class BackendError(Exception):
+    """An LLM request failed; `status` is the HTTP status when there was one."""
+
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """Interface shared by all chat-completion backends."""
+
+    def complete(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+                 timeout: float = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+               timeout: float = None) -> Iterator[str]:
+        """Yield the completion in pieces as it is generated; backends without streaming yield it whole."""
+        yield self.complete(messages, model, temperature, timeout)
+
+    def review(self, prompt: str, timeout: float = None) -> str:
+        return self.complete(review_messages(prompt), timeout=timeout).strip()
+
+    def review_stream(self, prompt: str, timeout: float = None) -> Iterator[str]:
+        return self.stream(review_messages(prompt), timeout=timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI-compatible `/chat/completions` client that reuses keep-alive connections."""
+
+    def __init__(self, api_key: str = None, base_url: str = DEFAULT_BASE_URL,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout: float = 120):
+        parts = urlsplit(base_url.rstrip("/"))
+        self.api_key = api_key
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = f"{parts.path}/chat/completions"
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        # Imported here rather than at the top: http.client (with ssl and email) is most of the
+        # CLI's start-up time, and cached or offline runs never open a connection
+        import http.client
+        self._http = http.client
+
+    def _new_connection(self, timeout: float):
+        conn_class = self._http.HTTPSConnection if self.https else self._http.HTTPConnection
+        return conn_class(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout: float):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _send(self, conn, body: bytes):
+        try:
+            conn.request("POST", self.path, body=body, headers=self._headers())
+            return conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    def _post(self, payload: Dict, timeout: float):
+        """Send a request on a pooled connection, returning (connection, response)."""
+        body = json.dumps(payload).encode("utf-8")
+        conn, reused = self._acquire(timeout)
+        try:
+            return conn, self._send(conn, body)
+        except (self._http.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection; retry once on a fresh one
+        conn = self._new_connection(timeout)
+        return conn, self._send(conn, body)
+
+    def _raise_for_status(self, response, body: bytes) -> None:
+        if response.status < 400:
+            return
+        retry_after = response.getheader("Retry-After")
+        try:
+            message = json.loads(body)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = body.decode("utf-8", "replace")[:200]
+        raise BackendError(
+            f"HTTP {response.status}: {message}",
+            status=response.status,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+
+    def complete(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+                 timeout: float = None) -> str:
+        payload = {"model": model, "messages": messages, "temperature": temperature}
+        try:
+            conn, response = self._post(payload, timeout or self.timeout)
+        except (OSError, self._http.HTTPException) as e:
+            raise BackendError(f"{type(e).__name__}: {e}") from e
+        reusable = False
+        try:
+            body = response.read()
+            reusable = not response.will_close
+        except (OSError, self._http.HTTPException) as e:
+            raise BackendError(f"{type(e).__name__}: {e}") from e
+        finally:
+            if reusable:
+                self._release(conn)
+            else:
+                conn.close()
+        self._raise_for_status(response, body)
+        return json.loads(body)["choices"][0]["message"]["content"]
+
+    def stream(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+               timeout: float = None) -> Iterator[str]:
+        payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+        try:
+            conn, response = self._post(payload, timeout or self.timeout)
+        except (OSError, self._http.HTTPException) as e:
+            raise BackendError(f"{type(e).__name__}: {e}") from e
+        if response.status >= 400:
+            try:
+                body = response.read()
+            except (OSError, self._http.HTTPException) as e:
+                raise BackendError(f"{type(e).__name__}: {e}") from e
+            finally:
+                conn.close()
+            self._raise_for_status(response, body)
+
+        finished = False
+        try:
+            # Server-sent events: `data: {json}` lines, terminated by `data: [DONE]`
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+            response.read()
+            finished = True
+        except (OSError, self._http.HTTPException) as e:
+            raise BackendError(f"{type(e).__name__}: {e}") from e
+        finally:
+            # A half-read stream cannot be reused for the next request
+            if finished and not response.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class MockBackend(LLMBackend):
+    """Deterministic offline backend with optional latency and error injection.
+
+    Replies are derived from a hash of the prompt, so the same input always
+    produces the same review; `error_rate` makes a seeded fraction of calls fail
+    with HTTP 429 or 503.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 tokens_per_second: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def complete(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+                 timeout: float = None) -> str:
+        return "".join(self.stream(messages, model, temperature, timeout))
+
+    def stream(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+               timeout: float = None) -> Iterator[str]:
+        prompt = messages[-1]["content"]
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        with self._lock:
+            fail = self.error_rate and self._random.random() < self.error_rate
+        reply = mock_review(prompt, digest)
+
+        # `latency` is time to first token; `tokens_per_second` paces the rest
+        first_token = self.latency + self.jitter * digest[0] / 255
+        if timeout is not None and first_token > timeout:
+            time.sleep(timeout)
+            raise BackendError(f"mock request timed out after {timeout}s")
+        time.sleep(first_token)
+        if fail:
+            status = 429 if digest[1] % 2 else 503
+            raise BackendError(f"HTTP {status}: mock injected error", status=status, retry_after=0.1)
+
+        for piece in re.findall(r"\S+\s*|\s+", reply):
+            if self.tokens_per_second:
+                time.sleep(max(len(piece) / 4, 1) / self.tokens_per_second)
+            yield piece
+
+
+def review_messages(prompt: str) -> Messages:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+MOCK_FINDINGS = [
+    ("low", "naming", "Consider a more descriptive name for this identifier."),
+    ("medium", "error-handling", "Errors here are caught and printed but not re-raised or logged."),
+    ("low", "performance", "This query selects more columns than it uses; list them explicitly."),
+    ("info", "duplication", "This block repeats logic found elsewhere; extract a helper."),
+    ("medium", "edge-case", "Input is not validated before use; add an edge-case check."),
+    ("high", "sql-injection", "String-formatted SQL is open to injection; use bind parameters."),
+]
+
+
+def mock_review(prompt: str, digest: bytes) -> str:
+    """Build a plausible, deterministic review for a prompt, as JSON when the prompt asks for it."""
+    structured = "JSON array" in prompt
+    files = re.findall(r"^=== FILE: (.+?) \([\w#+ ]+\) ===\n(.*?)^=== END FILE", prompt, re.MULTILINE | re.DOTALL)
+    if files:
+        # Packed multi-file prompt: answer with one delimited section per file
+        sections = []
+        for name, code in files:
+            file_digest = hashlib.sha256(code.encode("utf-8")).digest()
+            body = _mock_file_review(1, max(code.count(chr(10)), 1), file_digest, structured)
+            sections.append(f"### FILE: {name}\n{body}")
+        return "\n\n".join(sections)
+
+    match = re.search(r"^Lines: (\d+)-(\d+)$", prompt, re.MULTILINE)
+    first, last = (int(match.group(1)), int(match.group(2))) if match else (1, max(prompt.count("\n"), 1))
+    return _mock_file_review(first, last, digest, structured)
+
+
+def _mock_file_review(first: int, last: int, digest: bytes, structured: bool) -> str:
+    span = max(last - first + 1, 1)
+    findings = []
+    for i in range(2 + digest[2] % 3):
+        line = first + digest[3 + i] % span
+        severity, category, message = MOCK_FINDINGS[digest[8 + i] % len(MOCK_FINDINGS)]
+        findings.append({"line_start": line, "line_end": line, "severity": severity,
+                         "category": category, "message": message, "suggestion": ""})
+    if structured:
+        return json.dumps(findings, indent=1)
+    return "\n".join(f"- L{f['line_start']}: {f['message']}" for f in findings)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_limits = {
+    "rpm": float(os.getenv("AI_REVIEWER_RPM", "0")) or None,
+    "tpm": float(os.getenv("AI_REVIEWER_TPM", "0")) or None,
+    "max_retries": int(os.getenv("AI_REVIEWER_MAX_RETRIES", "5")),
+    "concurrency": int(os.getenv("AI_REVIEWER_MAX_CONCURRENCY", "0")) or None
+}
+
+
+def create_backend(name: str = None) -> LLMBackend:
+    """Build a backend from AI_REVIEWER_BACKEND / OPENAI_* environment settings."""
+    name = (name or os.getenv("AI_REVIEWER_BACKEND", "openai")).lower()
+    if name == "mock":
+        return MockBackend(
+            latency=float(os.getenv("AI_REVIEWER_MOCK_LATENCY", "0")),
+            jitter=float(os.getenv("AI_REVIEWER_MOCK_JITTER", "0")),
+            error_rate=float(os.getenv("AI_REVIEWER_MOCK_ERROR_RATE", "0")),
+            tokens_per_second=float(os.getenv("AI_REVIEWER_MOCK_TOKENS_PER_SECOND", "0"))
+        )
+    if name == "openai":
+        return OpenAIBackend(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE", DEFAULT_BASE_URL),
+            pool_size=int(os.getenv("AI_REVIEWER_POOL_SIZE", DEFAULT_POOL_SIZE))
+        )
+    raise ValueError(f"Unknown backend {name!r} (expected 'openai' or 'mock')")
+
+
+def configure_limits(rpm: float = None, tpm: float = None, max_retries: int = None,
+                     concurrency: int = None) -> None:
+    """Set the rate budgets, retry count and request concurrency used when the shared backend is created.
+
+    Arguments left as None keep their AI_REVIEWER_* environment value; a budget or concurrency of 0
+    removes that limit."""
+    if rpm is not None:
+        _limits["rpm"] = rpm or None
+    if tpm is not None:
+        _limits["tpm"] = tpm or None
+    if max_retries is not None:
+        _limits["max_retries"] = max_retries
+    if concurrency is not None:
+        _limits["concurrency"] = concurrency or None
+
+
+def get_backend() -> LLMBackend:
+    """Return the process-wide backend so every caller shares one connection pool and rate budget."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            from rate_limit import RateLimitedBackend
+            _backend = RateLimitedBackend(create_backend(), **_limits)
+        return _backend
+
+
+def set_backend(backend: LLMBackend) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
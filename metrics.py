@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+logger = logging.getLogger("ai_reviewer.metrics")
+
+# Seconds; covers everything from a file read to a multi-minute generation
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGES = ("index", "read", "rules", "context", "compact", "prompt", "queue", "request_wait", "first_token", "completion")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Thread-safe counters and histograms, exported in the Prometheus text format."""
+
+    def __init__(self, prefix: str = "ai_reviewer"):
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], list] = {}  # [bucket counts..., sum, count]
+        self.help: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, help: str = "", **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.help.setdefault(name, ("counter", help))
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.help.setdefault(name, ("histogram", help))
+            series = self.histograms.setdefault(key, [0] * len(STAGE_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def stage_totals(self) -> Dict[str, Tuple[float, int]]:
+        """Total seconds and number of observations per stage."""
+        with self._lock:
+            return {dict(labels)["stage"]: (series[-2], series[-1])
+                    for (name, labels), series in self.histograms.items() if name == "stage_seconds"}
+
+    def render(self) -> str:
+        """Format every metric in the Prometheus text exposition format."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self.help.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {help}")
+                lines.append(f"# TYPE {full} {kind}")
+                if kind == "counter":
+                    for (n, labels), value in sorted(self.counters.items()):
+                        if n == name:
+                            lines.append(f"{full}{fmt(labels)} {value:g}")
+                    continue
+                for (n, labels), series in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(STAGE_BUCKETS, series):
+                        lines.append(f"{full}_bucket{fmt(labels, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{full}_bucket{fmt(labels, [('le', '+Inf')])} {series[-1]}")
+                    lines.append(f"{full}_sum{fmt(labels)} {series[-2]:.6f}")
+                    lines.append(f"{full}_count{fmt(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write a Prometheus textfile (e.g. for node_exporter's textfile collector) atomically."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+def log_event(event: str, **fields) -> None:
+    """Emit one structured (JSON) log line when metrics logging is enabled."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}))
+
+
+def record_stage(stage: str, seconds: float, **fields) -> None:
+    metrics.observe("stage_seconds", seconds, "Time spent in each review stage", stage=stage)
+    log_event("stage", stage=stage, seconds=round(seconds, 6), **fields)
+
+
+@contextmanager
+def timed(stage: str, **fields) -> Iterator[None]:
+    """Time a block as one observation of `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, **fields)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int) -> None:
+    metrics.inc("prompt_tokens_total", prompt_tokens, "Prompt tokens sent to the model")
+    metrics.inc("completion_tokens_total", completion_tokens, "Completion tokens received from the model")
+    log_event("tokens", prompt=prompt_tokens, completion=completion_tokens)
+
+
+def record_cache(hit: bool, store: str = "cache") -> None:
+    metrics.inc("cache_lookups_total", 1, "Review cache and state lookups", store=store,
+                result="hit" if hit else "miss")
+
+
+def summary() -> str:
+    """One-paragraph, human-readable account of where the time and tokens went."""
+    totals = metrics.stage_totals()
+    stages = ", ".join(f"{stage} {totals[stage][0]:.2f}s/{totals[stage][1]}" for stage in STAGES if stage in totals)
+    hits = sum(metrics.counter("cache_lookups_total", store=s, result="hit") for s in ("cache", "state"))
+    lookups = hits + sum(metrics.counter("cache_lookups_total", store=s, result="miss") for s in ("cache", "state"))
+    hit_rate = f"{hits / lookups:.0%}" if lookups else "n/a"
+    return (f"⏱️ Stage time (total/calls): {stages or 'none'}\n"
+            f"   Tokens: {metrics.counter('prompt_tokens_total'):.0f} prompt, "
+            f"{metrics.counter('completion_tokens_total'):.0f} completion; cache hit rate {hit_rate}")
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics from a daemon thread for the lifetime of the process."""
+    # Imported here: http.server pulls in http.client and email, which most runs never need
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("/metrics", ""):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,133 @@
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backend import BackendError, MockBackend
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    backend = MockBackend()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error: BackendError) -> None:
+        headers = {"Retry-After": str(max(int(error.retry_after or 1), 1))} if error.status == 429 else None
+        # The client adds its own "HTTP <status>:" prefix
+        message = re.sub(r"^HTTP \d+: ", "", str(error))
+        self._send_json(error.status or 500, {"error": {"message": message}}, headers)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            messages = request["messages"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": {"message": "invalid request body"}})
+            return
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        if request.get("stream"):
+            self._stream(request, messages)
+            return
+
+        try:
+            content = self.backend.complete(messages, request.get("model", "mock"), request.get("temperature", 0))
+        except BackendError as e:
+            self._send_error(e)
+            return
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        self._send_json(200, {
+            "id": f"mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4}
+        })
+
+    def _stream(self, request: dict, messages: list) -> None:
+        pieces = self.backend.stream(messages, request.get("model", "mock"), request.get("temperature", 0))
+        try:
+            first = next(pieces, None)
+        except BackendError as e:
+            self._send_error(e)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        created = int(time.time())
+        if first is not None:
+            self._write_event(request, created, first)
+        for piece in pieces:
+            self._write_event(request, created, piece)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, request: dict, created: int, piece: str) -> None:
+        event = {
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+        }
+        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, backend: MockBackend = None) -> ThreadingHTTPServer:
+    """Create a mock OpenAI-compatible server; call serve_forever() on the result."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"backend": backend or MockBackend()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server for offline reviews")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="base seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra seconds added per request, 0..jitter")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="simulated generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 429/503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    backend = MockBackend(args.latency, args.jitter, args.error_rate, args.tokens_per_second, args.seed)
+    server = serve(args.host, args.port, backend)
+    print(f"🤖 Mock LLM listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from chunker import count_tokens
+from llm_backend import MODEL, TEMPERATURE, BackendError, LLMBackend, Messages
+from metrics import metrics, record_stage, record_tokens, timed
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0  # seconds
+DEFAULT_MAX_DELAY = 60.0  # seconds
+EXPECTED_COMPLETION_TOKENS = 400  # reserved per request on top of the prompt
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until `amount` units are available; return the seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimitedBackend(LLMBackend):
+    """Wrap a backend with requests/tokens-per-minute budgets and retries with jittered backoff.
+
+    Every call first takes one request from the RPM bucket and an estimate of its
+    tokens from the TPM bucket. Rate-limit and transient failures are retried with
+    exponential backoff (full jitter), honoring Retry-After; a 429 also pauses all
+    other callers so a burst does not keep hammering the API. `concurrency` caps
+    the requests in flight at once, however many threads are calling.
+    """
+
+    def __init__(self, backend: LLMBackend, rpm: float = None, tpm: float = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, concurrency: int = None):
+        self.backend = backend
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_for_budget(self, prompt_tokens: int) -> None:
+        with timed("request_wait"):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            if self.requests:
+                self.requests.acquire(1)
+            if self.tokens:
+                self.tokens.acquire(prompt_tokens + EXPECTED_COMPLETION_TOKENS)
+
+    @contextmanager
+    def _request_slot(self) -> Iterator[None]:
+        if self.slots is None:
+            yield
+            return
+        with timed("request_wait"):
+            self.slots.acquire()
+        try:
+            yield
+        finally:
+            self.slots.release()
+
+    def _backoff(self, error: BackendError, attempt: int) -> float:
+        if error.retry_after is not None:
+            delay = error.retry_after + random.uniform(0, self.base_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if error.status == 429:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _should_retry(self, error: BackendError, attempt: int) -> bool:
+        retryable = error.status is None or error.status in RETRYABLE_STATUSES
+        metrics.inc("request_errors_total", 1, "Failed model requests, including retried ones",
+                    status=str(error.status or "network"))
+        return retryable and attempt < self.max_retries
+
+    def complete(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+                 timeout: float = None) -> str:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        attempt = 0
+        while True:
+            self._wait_for_budget(prompt_tokens)
+            try:
+                with self._request_slot(), timed("completion", prompt_tokens=prompt_tokens):
+                    content = self.backend.complete(messages, model, temperature, timeout)
+                record_tokens(prompt_tokens, count_tokens(content))
+                return content
+            except BackendError as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._backoff(e, attempt))
+                attempt += 1
+
+    def stream(self, messages: Messages, model: str = MODEL, temperature: float = TEMPERATURE,
+               timeout: float = None) -> Iterator[str]:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        attempt = 0
+        while True:
+            self._wait_for_budget(prompt_tokens)
+            started = False
+            pieces = []
+            try:
+                with self._request_slot():
+                    request_start = time.perf_counter()
+                    for piece in self.backend.stream(messages, model, temperature, timeout):
+                        if not started:
+                            started = True
+                            record_stage("first_token", time.perf_counter() - request_start)
+                        pieces.append(piece)
+                        yield piece
+                record_stage("completion", time.perf_counter() - request_start, prompt_tokens=prompt_tokens)
+                record_tokens(prompt_tokens, count_tokens("".join(pieces)))
+                return
+            except BackendError as e:
+                # Output already shown cannot be taken back, so only retry before the first piece
+                if started or not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._backoff(e, attempt))
+                attempt += 1
+
+    def close(self) -> None:
+        self.backend.close()
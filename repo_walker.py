@@ -0,0 +1,172 @@
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from languages import detect_language
+
+DEFAULT_WALK_JOBS = 8
+DEFAULT_MAX_FILE_BYTES = 512 * 1024  # larger files are data dumps, not code worth reviewing
+HEAD_BYTES = 8192  # how much of each file is read to spot binaries and generated code
+
+# Version control, third-party code and build output are never reviewed
+VENDORED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "vendor", "vendored", "third_party", "site-packages",
+    ".venv", "venv", "__pycache__", ".tox", ".nox", ".mypy_cache", ".pytest_cache",
+    "dist", "build", "target", ".eggs",
+}
+GENERATED_NAME_RE = re.compile(r"(_pb2(_grpc)?\.py|\.min\.js|[._-]generated\.\w+|\.pb\.go)$")
+GENERATED_MARKER_RE = re.compile(rb"@generated|DO NOT EDIT|Code generated by|[Aa]uto-?generated (?:by|from|file)")
+
+
+@dataclass
+class IgnoreRule:
+    """One `.gitignore` line, compiled to a regex over paths relative to the file that defines it."""
+    base: str
+    regex: re.Pattern
+    negate: bool = False
+    dir_only: bool = False
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return False
+            rel_path = rel_path[len(self.base) + 1:]
+        return self.regex.match(rel_path) is not None
+
+
+def _glob_to_regex(pattern: str) -> str:
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            parts.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+def parse_ignore_line(line: str, base: str = "") -> Optional[IgnoreRule]:
+    """Compile one gitignore-syntax pattern; blank lines and comments give None."""
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate or line.startswith("\\"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    # A slash anywhere but the end (including a leading one) anchors the pattern to the .gitignore's directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = "" if anchored else "(?:.*/)?"
+    return IgnoreRule(base, re.compile(f"{prefix}{_glob_to_regex(line)}$"), negate, dir_only)
+
+
+def read_ignore_file(path: str, base: str = "") -> List[IgnoreRule]:
+    try:
+        with open(path, "r", errors="replace") as f:
+            return [rule for rule in (parse_ignore_line(line, base) for line in f) if rule]
+    except OSError:
+        return []
+
+
+def is_ignored(rules: Iterable[IgnoreRule], rel_path: str, is_dir: bool) -> bool:
+    ignored = False
+    for rule in rules:  # later rules override earlier ones, as in git
+        if rule.matches(rel_path, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+def skip_reason(name: str, head: bytes) -> Optional[str]:
+    """Why a candidate file should not be reviewed, or None if it should."""
+    if b"\0" in head:
+        return "binary"
+    if GENERATED_NAME_RE.search(name) or GENERATED_MARKER_RE.search(head[:1024]):
+        return "generated"
+    return None
+
+
+def _scan_directory(root: str, rel_dir: str, rules: Tuple[IgnoreRule, ...], languages, max_bytes: int):
+    """List one directory: return (files to review, subdirectories to descend into, their rules)."""
+    directory = os.path.join(root, rel_dir) if rel_dir else root
+    rules = rules + tuple(read_ignore_file(os.path.join(directory, ".gitignore"), rel_dir))
+    files = []
+    subdirs = []
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: e.name)
+    except OSError:
+        return files, subdirs, rules
+
+    for entry in entries:
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in VENDORED_DIRS and not is_ignored(rules, rel_path, True):
+                    subdirs.append(rel_path)
+                continue
+            if not entry.is_file(follow_symlinks=False) or is_ignored(rules, rel_path, False):
+                continue
+            language = detect_language(entry.name)
+            if language is None and "." in entry.name:
+                continue  # only extensionless files can still be scripts with a #! line
+            if entry.stat().st_size > max_bytes:
+                continue
+            with open(entry.path, "rb") as f:
+                head = f.read(HEAD_BYTES)
+        except OSError:
+            continue
+        language = language or detect_language(entry.name, head)
+        if language is None or (languages and language not in languages):
+            continue
+        if skip_reason(entry.name, head) is None:
+            files.append(rel_path)
+    return files, subdirs, rules
+
+
+def walk_repo(root: str, excludes: Iterable[str] = (), languages: Iterable[str] = None,
+              jobs: int = DEFAULT_WALK_JOBS, max_bytes: int = DEFAULT_MAX_FILE_BYTES) -> Iterator[str]:
+    """Yield reviewable source files under `root` as they are discovered.
+
+    Directories are listed concurrently, but results come out in breadth-first,
+    name-sorted order so repeated runs see the same sequence. `.gitignore` files
+    (and `.git/info/exclude`) are honored at every level; `excludes` are extra
+    gitignore-style patterns relative to `root`.
+    """
+    wanted = set(languages) if languages else None
+    rules = tuple(read_ignore_file(os.path.join(root, ".git", "info", "exclude")))
+    rules += tuple(rule for rule in (parse_ignore_line(p) for p in excludes) if rule)
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        pending = deque([pool.submit(_scan_directory, root, "", rules, wanted, max_bytes)])
+        while pending:
+            files, subdirs, dir_rules = pending.popleft().result()
+            for subdir in subdirs:
+                pending.append(pool.submit(_scan_directory, root, subdir, dir_rules, wanted, max_bytes))
+            for rel_path in files:
+                yield os.path.join(root, rel_path)
+    finally:
+        # The consumer may stop early; do not keep listing the rest of the tree
+        pool.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from metrics import record_cache
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "AI_REVIEWER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai_reviewer")
+)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+def cache_key(*parts) -> str:
+    """Hash the inputs that determine a review (prompt version, model, temperature, content...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """Content-addressed on-disk store of review results with size-bounded LRU eviction.
+
+    Each entry is one JSON file; its mtime is bumped on every hit so the oldest
+    mtime is always the least recently used entry.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # computed lazily on first write
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            record_cache(False)
+            return None
+        record_cache(True)
+        return entry.get("review")
+
+    def put(self, key: str, review: str) -> None:
+        """Store a review; a cache that cannot be written is skipped rather than failing the review."""
+        path = self._path(key)
+        data = json.dumps({"review": review, "created": time.time()})
+        # Unique per process and thread: several reviewers may share one cache directory
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            try:
+                if self._total_bytes is None:
+                    self._total_bytes = self._scan_size()
+                else:
+                    self._total_bytes += len(data.encode("utf-8")) - old_size
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+            except OSError:
+                self._total_bytes = None  # rescan on the next write
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self) -> None:
+        # Drop least recently used entries until we are back under 90% of the limit
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
@@ -0,0 +1,41 @@
+import json
+from typing import Iterator
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+class ServerError(Exception):
+    pass
+
+
+def _open(request, timeout: float):
+    try:
+        return urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        try:
+            message = json.loads(e.read())["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = e.reason
+        raise ServerError(f"HTTP {e.code}: {message}") from None
+
+
+def submit_review(server: str, payload: dict, timeout: float = 60) -> dict:
+    """POST a review job ({"files": [...]} or {"diff": ...}) and return its id and URLs."""
+    request = Request(f"{server.rstrip('/')}/v1/reviews", data=json.dumps(payload).encode("utf-8"),
+                      headers={"Content-Type": "application/json"}, method="POST")
+    with _open(request, timeout) as response:
+        return json.loads(response.read())
+
+
+def get_review(server: str, job_id: str, since: int = 0, timeout: float = 60) -> dict:
+    """Poll a job: its status plus the results after the first `since`."""
+    with _open(f"{server.rstrip('/')}/v1/reviews/{job_id}?since={since}", timeout) as response:
+        return json.loads(response.read())
+
+
+def stream_review(server: str, job_id: str, timeout: float = 60) -> Iterator[dict]:
+    """Yield a job's events (results, progress, then "done") as the server sends them."""
+    with _open(f"{server.rstrip('/')}/v1/reviews/{job_id}/events", timeout) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
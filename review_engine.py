@@ -0,0 +1,83 @@
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+from metrics import record_stage
+
+
+def _after_queue(work: Callable, item: Any, submitted: float, *args):
+    # Time between submission and a free worker picking the item up
+    record_stage("queue", time.perf_counter() - submitted)
+    return work(item, *args)
+
+
+def run_reviews(items: Iterable[Any], review: Callable[[Any], str], jobs: int = 4) -> Iterator[Tuple[Any, str]]:
+    """Run `review` over items on a bounded thread pool, yielding (item, result) in input order."""
+    jobs = max(1, jobs)
+    window = jobs * 2  # in-flight limit so `items` can be a lazy stream
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for item in items:
+            pending.append((item, executor.submit(_after_queue, review, item, time.perf_counter())))
+            # Flush every finished result at the head so output keeps input order
+            while pending and (len(pending) >= window or pending[0][1].done()):
+                head, future = pending.popleft()
+                yield head, future.result()
+
+        while pending:
+            head, future = pending.popleft()
+            yield head, future.result()
+
+
+_DONE = object()
+
+
+def run_streaming(items: Iterable[Any], stream: Callable[[Any], Iterable[str]],
+                  jobs: int = 4) -> Iterator[Tuple[Any, Iterator[str]]]:
+    """Like run_reviews, but each result is an iterator of text pieces.
+
+    Items are produced concurrently; the head item's pieces can be consumed
+    while it is still generating, and later items buffer until their turn.
+    Exceptions raised by `stream` surface when the pieces are consumed.
+    """
+    jobs = max(1, jobs)
+    window = jobs * 2
+    items = iter(items)
+    pending = deque()
+
+    def produce(item, pieces: queue.Queue) -> None:
+        try:
+            for piece in stream(item):
+                pieces.put(piece)
+        except Exception as e:
+            pieces.put(e)
+        finally:
+            pieces.put(_DONE)
+
+    def consume(pieces: queue.Queue) -> Iterator[str]:
+        while True:
+            piece = pieces.get()
+            if piece is _DONE:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        def fill():
+            while len(pending) < window:
+                item = next(items, _DONE)
+                if item is _DONE:
+                    return
+                pieces = queue.Queue()
+                executor.submit(_after_queue, produce, item, time.perf_counter(), pieces)
+                pending.append((item, pieces))
+
+        fill()
+        while pending:
+            item, pieces = pending.popleft()
+            yield item, consume(pieces)
+            fill()
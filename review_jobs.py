@@ -0,0 +1,92 @@
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from ai_reviewer import ReviewOptions, review_key, stream_review_code
+
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_JOBS = 512  # finished jobs kept in memory before the oldest are evicted
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass
+class ReviewJob:
+    key: str
+    filename: str
+    state: str = QUEUED
+    pieces: List[str] = field(default_factory=list)  # review text received so far
+    error: str = None
+    submitted: float = field(default_factory=time.time)
+    finished: float = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in (DONE, FAILED)
+
+    @property
+    def review(self) -> str:
+        return "".join(self.pieces)
+
+
+class ReviewJobs:
+    """Process-wide background review queue shared by every user session.
+
+    Jobs are keyed by the same content hash as the review cache, so identical
+    uploads from different sessions share one job, and finished jobs are
+    memoized (LRU, `max_jobs` entries) on top of the on-disk cache.
+    """
+
+    def __init__(self, options: ReviewOptions, workers: int = DEFAULT_WORKERS, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.options = options
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review")
+
+    def job_key(self, code: str, filename: str) -> str:
+        return review_key(code, filename, self.options)
+
+    def submit(self, code: str, filename: str, refresh: bool = False) -> ReviewJob:
+        """Start reviewing a file unless an identical one is already queued, running or done."""
+        key = self.job_key(code, filename)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and not (refresh and job.done):
+                self._jobs.move_to_end(key)
+                return job
+            job = self._jobs[key] = ReviewJob(key, filename)
+            self._evict()
+        options = dataclasses.replace(self.options, refresh=refresh) if refresh else self.options
+        self._executor.submit(self._run, job, code, options)
+        return job
+
+    def get(self, key: str) -> Optional[ReviewJob]:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job:
+                self._jobs.move_to_end(key)
+            return job
+
+    def _run(self, job: ReviewJob, code: str, options: ReviewOptions) -> None:
+        job.state = RUNNING
+        try:
+            for piece in stream_review_code(code, job.filename, options):
+                job.pieces.append(piece)
+            job.state = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+        job.finished = time.time()
+
+    def _evict(self) -> None:
+        # Only finished jobs are dropped; running ones still have someone waiting on them
+        for key in [k for k, j in self._jobs.items() if j.done][:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[key]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,325 @@
+import argparse
+import dataclasses
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from ai_reviewer import (DEFAULT_JOBS, DEFAULT_TIMEOUT, ReviewOptions, analyze_hunk, hunk_findings,
+                         review_sources)
+from diff_review import parse_unified_diff
+from llm_backend import configure_limits
+from metrics import metrics
+from review_cache import DEFAULT_CACHE_DIR, ReviewCache
+from review_engine import run_reviews
+from review_jobs import DONE, FAILED, QUEUED, RUNNING
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_JOBS = 4  # client jobs reviewed at once; the rest wait in line
+DEFAULT_CONCURRENCY = 16  # model requests in flight across all jobs
+DEFAULT_RETAIN = 3600  # seconds a finished job stays available to pollers
+DEFAULT_MAX_BODY_BYTES = 32 * 1024 * 1024
+KEEPALIVE_SECONDS = 15  # idle event streams get a progress line this often
+RESULT_FORMATS = ("text", "json")
+
+
+@dataclass
+class ServerJob:
+    """One client submission: a set of files or a diff, with results appended in input order."""
+    id: str
+    total: int
+    status: str = QUEUED
+    results: List[dict] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+    error: str = None
+    created: float = field(default_factory=time.time)
+    finished: float = None
+    changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def add(self, result: dict, failure: str = None) -> None:
+        with self.changed:
+            self.results.append(result)
+            if failure:
+                self.failures.append(failure)
+            self.changed.notify_all()
+
+    def finish(self, error: str = None) -> None:
+        with self.changed:
+            self.status = FAILED if error else DONE
+            self.error = error
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def wait(self, seen: int, timeout: float) -> Tuple[List[dict], bool]:
+        """Block until there are results past `seen` or the job ends; return (new results, done)."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.results) > seen or self.done, timeout)
+            return self.results[seen:], self.done
+
+    def to_dict(self, since: int = 0) -> dict:
+        with self.changed:
+            return {"id": self.id, "status": self.status, "total": self.total, "completed": len(self.results),
+                    "results": self.results[since:], "failures": list(self.failures), "error": self.error}
+
+
+class ReviewService:
+    """Runs client jobs on a bounded pool; every job shares one cache, backend and rate budget."""
+
+    def __init__(self, options: ReviewOptions, max_jobs: int = DEFAULT_MAX_JOBS, retain: float = DEFAULT_RETAIN):
+        self.options = options
+        self.retain = retain
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+
+    def submit(self, request: dict) -> ServerJob:
+        """Validate a request body and queue it; raises ValueError for a bad request."""
+        if not isinstance(request, dict):
+            raise ValueError("request body must be a JSON object")
+        result_format = request.get("format", "text")
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(RESULT_FORMATS)}")
+        options = dataclasses.replace(self.options, structured=result_format == "json",
+                                      refresh=bool(request.get("refresh")))
+        files, diff = request.get("files"), request.get("diff")
+        if (files is None) == (diff is None):
+            raise ValueError("give either 'files' or 'diff'")
+        if files is not None:
+            if not isinstance(files, list) or not all(
+                    isinstance(f, dict) and isinstance(f.get("path"), str) and isinstance(f.get("content"), str)
+                    for f in files):
+                raise ValueError("'files' must be a list of {\"path\": ..., \"content\": ...}")
+            kind, work = "files", self._review_files
+            items = [(f["path"], f["content"]) for f in files]
+        else:
+            if not isinstance(diff, str):
+                raise ValueError("'diff' must be unified diff text")
+            kind, work = "diff", self._review_hunks
+            items = [(file_diff, hunk) for file_diff in parse_unified_diff(diff) for hunk in file_diff.hunks]
+
+        job = ServerJob(uuid.uuid4().hex, len(items))
+        with self._lock:
+            self._expire()
+            self.jobs[job.id] = job
+        metrics.inc("server_jobs_total", 1, "Review jobs submitted to the server", kind=kind)
+        self._executor.submit(self._run, job, work, items, options)
+        return job
+
+    def get(self, job_id: str) -> ServerJob:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: ServerJob, work, items: list, options: ReviewOptions) -> None:
+        job.status = RUNNING
+        try:
+            work(job, items, options)
+        except Exception as e:
+            job.finish(str(e))
+            return
+        job.finish()
+
+    def _review_files(self, job: ServerJob, items: list, options: ReviewOptions) -> None:
+        for file_review in review_sources(items, options):
+            result = {"path": file_review.path}
+            if options.structured:
+                result["findings"] = [f.to_dict() for f in file_review.all_findings()]
+            else:
+                result["report"] = file_review.report()
+            if file_review.failure:
+                result["error"] = file_review.failure
+            job.add(result, file_review.failure)
+
+    def _review_hunks(self, job: ServerJob, items: list, options: ReviewOptions) -> None:
+        def review(item):
+            file_diff, hunk = item
+            try:
+                if options.structured:
+                    return [f.to_dict() for f in hunk_findings(file_diff, hunk, options)], None
+                return analyze_hunk(file_diff, hunk, options), None
+            except Exception as e:
+                return None, f"{file_diff.path}:{hunk.new_start}: {e}"
+
+        for (file_diff, hunk), (found, error) in run_reviews(items, review, jobs=options.jobs):
+            result = {"path": file_diff.path, "lines": [hunk.new_start, hunk.new_end]}
+            if error:
+                result["error"] = error
+            elif options.structured:
+                result["findings"] = found
+            else:
+                result["report"] = found
+            job.add(result, error)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.retain
+        for job_id in [i for i, job in self.jobs.items() if job.done and job.finished < cutoff]:
+            del self.jobs[job_id]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ReviewHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: ReviewService = None
+    max_body_bytes = DEFAULT_MAX_BODY_BYTES
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"message": message}})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/v1/reviews":
+            self._send_error(404, f"unknown path {self.path}")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > self.max_body_bytes:
+            self._send_error(413, f"request body over {self.max_body_bytes} bytes")
+            self.close_connection = True
+            return
+        try:
+            job = self.service.submit(json.loads(self.rfile.read(length)))
+        except ValueError as e:  # includes malformed JSON
+            self._send_error(400, str(e))
+            return
+        self._send_json(202, {"id": job.id, "status": job.status, "total": job.total,
+                              "url": f"/v1/reviews/{job.id}", "events": f"/v1/reviews/{job.id}/events"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if url.path.rstrip("/") == "/metrics":
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url.path.rstrip("/") == "/healthz":
+            self._send_json(200, {"status": "ok"})
+            return
+        if len(parts) not in (3, 4) or parts[:2] != ["v1", "reviews"] or parts[3:] not in ([], ["events"]):
+            self._send_error(404, f"unknown path {self.path}")
+            return
+        job = self.service.get(parts[2])
+        if job is None:
+            self._send_error(404, f"no such job {parts[2]}")
+            return
+        try:
+            since = int(parse_qs(url.query).get("since", ["0"])[0])
+        except ValueError:
+            self._send_error(400, "'since' must be an integer")
+            return
+        if len(parts) == 3:
+            self._send_json(200, job.to_dict(since))
+        else:
+            self._stream(job, since)
+
+    def _stream(self, job: ServerJob, seen: int) -> None:
+        """Send results as NDJSON while the job runs, ending with a "done" event."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                results, done = job.wait(seen, KEEPALIVE_SECONDS)
+                lines = [{"event": "result", "index": seen + i, **result} for i, result in enumerate(results)]
+                seen += len(results)
+                if done:
+                    lines.append({"event": "done", "status": job.status, "total": job.total,
+                                  "failures": job.failures, "error": job.error})
+                elif not results:
+                    lines.append({"event": "progress", "completed": seen, "total": job.total})
+                self._write_chunk("".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"))
+                if done:
+                    break
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client went away; the job keeps running
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(service: ReviewService, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          max_body_bytes: int = DEFAULT_MAX_BODY_BYTES) -> ThreadingHTTPServer:
+    """Create the review server; call serve_forever() on the result."""
+    handler = type("ConfiguredReviewHandler", (ReviewHandler,),
+                   {"service": service, "max_body_bytes": max_body_bytes})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Long-running review service: CI clients POST files or diffs and poll or stream results")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS,
+                        help=f"client jobs reviewed at once; later ones queue (default: {DEFAULT_MAX_JOBS})")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"files reviewed concurrently within one job (default: {DEFAULT_JOBS})")
+    parser.add_argument("--concurrency", type=int,
+                        help="model requests in flight across all jobs; 0 means unlimited "
+                             f"(default: $AI_REVIEWER_MAX_CONCURRENCY, else {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--rpm", type=float,
+                        help="requests-per-minute budget shared by all clients; 0 means unlimited "
+                             "(default: $AI_REVIEWER_RPM, else unlimited)")
+    parser.add_argument("--tpm", type=float,
+                        help="tokens-per-minute budget shared by all clients; 0 means unlimited "
+                             "(default: $AI_REVIEWER_TPM, else unlimited)")
+    parser.add_argument("--max-retries", type=int,
+                        help="retries for rate-limited or transient API errors "
+                             "(default: $AI_REVIEWER_MAX_RETRIES, else 5)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"per-request timeout in seconds (default: {DEFAULT_TIMEOUT})")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"review cache location (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--compact", action="store_true", help="compact prompts, as ai_reviewer.py --compact")
+    parser.add_argument("--retain", type=float, default=DEFAULT_RETAIN,
+                        help=f"seconds finished jobs stay available (default: {DEFAULT_RETAIN})")
+    args = parser.parse_args(argv)
+
+    concurrency = args.concurrency
+    if concurrency is None and "AI_REVIEWER_MAX_CONCURRENCY" not in os.environ:
+        concurrency = DEFAULT_CONCURRENCY
+    configure_limits(args.rpm, args.tpm, args.max_retries, concurrency)
+    options = ReviewOptions(timeout=args.timeout, cache=ReviewCache(args.cache_dir), jobs=args.jobs,
+                            compact=args.compact)
+    service = ReviewService(options, args.max_jobs, args.retain)
+    server = serve(service, args.host, args.port)
+    print(f"🤖 Review server listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
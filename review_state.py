@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+from findings import Finding
+from metrics import record_cache
+
+DEFAULT_STATE_FILE = ".ai_reviewer_state.sqlite"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    review_key TEXT NOT NULL,  -- cache_key of prompt version, model and content
+    review TEXT NOT NULL,
+    findings TEXT NOT NULL,    -- JSON list of findings, each with its match keys
+    updated REAL NOT NULL
+)
+"""
+
+
+def finding_keys(finding: Finding, lines: List[str]) -> List[str]:
+    """Keys that identify a finding across runs even when surrounding lines move.
+
+    A finding matches an earlier one with the same category if either the code it
+    points at or its (normalized) message is the same.
+    """
+    code = " ".join(line.strip() for line in lines[finding.line_start - 1:finding.line_end])
+    message = re.sub(r"[^a-z]+", " ", finding.message.lower()).strip()
+    keys = [f"m:{finding.category}:{message}"]
+    if code:
+        keys.append(f"c:{finding.category}:{code}")
+    return [hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] for key in keys]
+
+
+@dataclass
+class StateDiff:
+    """How a file's findings compare with the previous run."""
+    new: List[Finding] = field(default_factory=list)
+    unchanged: List[Finding] = field(default_factory=list)
+    resolved: List[Finding] = field(default_factory=list)
+
+    def add(self, other: "StateDiff") -> None:
+        self.new += other.new
+        self.unchanged += other.unchanged
+        self.resolved += other.resolved
+
+    def summary(self) -> str:
+        return f"{len(self.new)} new, {len(self.resolved)} resolved, {len(self.unchanged)} unchanged"
+
+
+class ReviewState:
+    """SQLite record of the last review of every file, for incremental CI runs.
+
+    A file whose review key (content plus prompt version and model) matches the
+    stored one is not sent to the LLM again; its previous review is reused.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_FILE):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        import sqlite3  # only runs that pass --state need it
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS files")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.execute(SCHEMA)
+
+    def lookup(self, path: str, review_key: str) -> Optional[str]:
+        """Return the stored review if the file was last reviewed with the same key."""
+        with self._lock:
+            row = self._db.execute("SELECT review_key, review FROM files WHERE path = ?", (path,)).fetchone()
+        hit = bool(row) and row[0] == review_key
+        record_cache(hit, store="state")
+        return row[1] if hit else None
+
+    def _previous(self, path: str) -> List[Tuple[Finding, List[str]]]:
+        with self._lock:
+            row = self._db.execute("SELECT findings FROM files WHERE path = ?", (path,)).fetchone()
+        if not row:
+            return []
+        previous = []
+        for item in json.loads(row[0]):
+            keys = item.pop("keys")
+            previous.append((Finding(**item), keys))
+        return previous
+
+    def update(self, path: str, review_key: str, review: str, findings: List[Finding], code: str) -> StateDiff:
+        """Store this run's findings for a file and classify them against the last run."""
+        lines = code.splitlines()
+        previous = self._previous(path)
+        seen = {key for _, keys in previous for key in keys}
+        diff = StateDiff()
+        current_keys = set()
+        stored = []
+        for finding in findings:
+            keys = finding_keys(finding, lines)
+            current_keys.update(keys)
+            (diff.unchanged if seen.intersection(keys) else diff.new).append(finding)
+            stored.append({**vars(finding), "keys": keys})
+        diff.resolved = [finding for finding, keys in previous if not current_keys.intersection(keys)]
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, review_key, review, findings, updated) VALUES (?, ?, ?, ?, ?)",
+                (path, review_key or "", review or "", json.dumps(stored), time.time())
+            )
+        return diff
+
+    def prune(self, seen_paths: Iterable[str], root: str) -> StateDiff:
+        """Forget files under `root` that no longer exist in this run; their findings count as resolved."""
+        seen = set(seen_paths)
+        prefix = os.path.join(root, "")
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM files").fetchall()
+        diff = StateDiff()
+        for (path,) in rows:
+            if path.startswith(prefix) and path not in seen:
+                diff.resolved += [finding for finding, _ in self._previous(path)]
+                with self._lock, self._db:
+                    self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+        return diff
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
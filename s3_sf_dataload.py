@@ -1,5 +1,6 @@
 import snowflake.connector
 import boto3
+import argparse
 import csv
 import json
 import pandas as pd
@@ -8,10 +9,12 @@ import queue
 import logging
 import datetime
 import re
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Tuple
+import codecs
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Iterable, Iterator, Tuple
 import hashlib
 import uuid
+from collections import OrderedDict
 from io import StringIO
 
 # Configuration
@@ -33,33 +36,89 @@ S3_CONFIG = {
 
 
 SIZE_THRESHOLD = 200 * 1024 * 1024  # 200 MB in bytes
-BATCH_SIZE = 100
+BATCH_SIZE = 100  # files in flight at once; the listing is only read ahead this far
 MAX_WORKERS = 10
+LIST_PAGE_SIZE = 1000  # keys per list_objects_v2 call (the S3 maximum)
+READ_CHUNK_SIZE = 8 * 1024 * 1024  # bytes read from an S3 body at a time, so memory per file stays constant
+SCHEMA_SAMPLE_ROWS = 10  # leading rows kept for schema inference
+# Server-side metadata: row counts come from COPY INTO, the S3 ETag is the file fingerprint and the schema
+# is inferred from a ranged GET of the first bytes, so large files are never downloaded into Python.
+# Off by default: file_hash then holds the ETag rather than an MD5 of the content (the two differ for
+# multipart uploads) and record_count is COPY's rows_loaded. Enable it with --server-side-metadata.
+SERVER_SIDE_METADATA = False
+SCHEMA_SAMPLE_BYTES = 64 * 1024  # first ranged GET; doubled until a header line or first record fits
+MAX_SCHEMA_SAMPLE_BYTES = 8 * 1024 * 1024
+MAX_FILES_PER_COPY = 1000  # Snowflake's limit on FILES = (...) in one COPY INTO
+COPY_WINDOW = 5000  # listed files a table's partial COPY batch may wait for before it is sent anyway
 LOG_FILE = 's3_to_snowflake.log'
 
 
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class SnowflakeManager:
-    def __init__(self):
+    def __init__(self, server_side_metadata: bool = SERVER_SIDE_METADATA):
         self.conn = snowflake.connector.connect(**SNOWFLAKE_CONFIG)
         self.cursor = self.conn.cursor()
+        self.server_side_metadata = server_side_metadata
+        self.created_tables = set()
+        self._table_locks = {}
+        self._lock = threading.Lock()
 
     def create_table(self, table_name: str, schema: List[Tuple[str, str]]) -> None:
         columns = ", ".join([f"{col_name} {col_type}" for col_name, col_type in schema])
         query = f"CREATE OR REPLACE TABLE {table_name} ({columns}, load_timestamp TIMESTAMP, file_hash VARCHAR)"
         self.cursor.execute(query)
-        logging.info(f""Created table {table_name}")
-
-    def copy_into_table1(self, s3_path: str, table_name: str, file_format: str) -> None:
-        format_options = "SKIP_HEADER = 1" if file_format == 'CSV' else "TRIM_SPACE = TRUE"
+        logging.info(f"Created table {table_name}")
+
+    def ensure_table(self, table_name: str, get_schema) -> None:
+        """Create a target table once per run, before its first COPY; `get_schema` is only called then."""
+        with self._lock:
+            table_lock = self._table_locks.setdefault(table_name, threading.Lock())
+        with table_lock:
+            if table_name not in self.created_tables:
+                self.create_table(table_name, get_schema())
+                self.created_tables.add(table_name)
+
+    def _copy(self, query: str) -> List[Dict]:
+        # A cursor per statement: the shared one would let concurrent workers read each other's results
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query)
+            columns = [column[0].lower() for column in cursor.description or []]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def copy_into_table1(self, s3_path: str, table_name: str, file_format: str) -> List[Dict]:
+        """Run COPY INTO and return its per-file results (file, status, rows_parsed, rows_loaded, errors_seen, ...)."""
         query = f"""
         COPY INTO {table_name}
         FROM '{s3_path}'
-        FILE_FORMAT = (TYPE = {file_format} {format_options})
+        FILE_FORMAT = (TYPE = {file_format} {format_options(file_format)})
         """
-        self.cursor.execute(query)
-        logging.info(f"Loaded {s3_path} into {table_name}")
+        results = self._copy(query)
+        logging.info(f"Loaded {s3_path} into {table_name}: {rows_loaded(results)} rows")
+        return results
+
+    def copy_files(self, table_name: str, keys: List[str], file_format: str) -> Dict[str, Dict]:
+        """Load up to MAX_FILES_PER_COPY objects with one COPY INTO ... FILES = (...) and return the
+        result row for each key. Keys COPY did not report on (skipped by its load history) have no entry."""
+        location = f"s3://{S3_CONFIG['bucket']}/"
+        files = ", ".join(sql_string(key) for key in keys)
+        query = f"""
+        COPY INTO {table_name}
+        FROM '{location}'
+        FILES = ({files})
+        FILE_FORMAT = (TYPE = {file_format} {format_options(file_format)})
+        ON_ERROR = SKIP_FILE
+        """
+        paths = {f"{location}{key}": key for key in keys}
+        results = {}
+        for result in self._copy(query):
+            if result.get('file') in paths:
+                results[paths[result['file']]] = result
+        logging.info(f"Loaded {len(keys)} files into {table_name}: {rows_loaded(list(results.values()))} rows")
+        return results
 
     def insert_metadata1(self, table_name: str, metadata: Dict) -> None:
         query = f"""
@@ -71,11 +130,49 @@ class SnowflakeManager:
         self.cursor.execute(query)
         logging.info(f"Inserted metadata for {metadata['file_name']}")
 
+    def insert_metadata_rows(self, rows: List[Dict]) -> None:
+        """Record many loads at once; the connector sends an executemany INSERT as one multi-row statement."""
+        query = """
+        INSERT INTO METADATA_TABLE
+        (file_name, file_size_mb, table_name, load_timestamp, file_hash, record_count)
+        VALUES (%(file_name)s, %(file_size_mb)s, %(table_name)s, %(load_timestamp)s, %(file_hash)s, %(record_count)s)
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(query, rows)
+        finally:
+            cursor.close()
+        logging.info(f"Inserted metadata for {len(rows)} files")
+
+    def recorded_loads(self, keys: List[str]) -> Dict[str, set]:
+        """file_name -> file hashes of the loads METADATA_TABLE already records for these keys."""
+        query = f"SELECT file_name, file_hash FROM METADATA_TABLE WHERE file_name IN ({', '.join(['%s'] * len(keys))})"
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, keys)
+            recorded = {}
+            for file_name, file_hash in cursor.fetchall():
+                recorded.setdefault(file_name, set()).add(file_hash)
+            return recorded
+        finally:
+            cursor.close()
+
     def close(self) -> None:
         self.cursor.close()
         self.conn.close()
 
-class s3manager:
+def sql_string(value: str) -> str:
+    # Snowflake string literals treat a backslash as an escape, so double it before the quotes
+    return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+def format_options(file_format: str) -> str:
+    return "SKIP_HEADER = 1" if file_format == 'CSV' else "TRIM_SPACE = TRUE STRIP_OUTER_ARRAY = TRUE"
+
+def rows_loaded(copy_results: List[Dict]) -> int:
+    # A file loaded before reports only a status ("Copy executed with 0 files processed."), i.e. 0 rows
+    return sum(int(result.get('rows_loaded') or 0) for result in copy_results)
+
+class S3Manager:
     def __init__(self):
         self.s3_client = boto3.client(
             's3',
@@ -83,28 +180,219 @@ class s3manager:
             aws_secret_access_key=S3_CONFIG['aws_secret_key']
         )
 
+    def iter_files(self, prefix: str) -> Iterator[Dict]:
+        """Yield every object under `prefix` as listing pages arrive, following continuation tokens."""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=S3_CONFIG['bucket'], Prefix=prefix,
+                                   PaginationConfig={'PageSize': LIST_PAGE_SIZE})
+        for page in pages:
+            yield from page.get('Contents', [])
+
     def List_Files(self, prefix: str) -> List[Dict]:
-        response = self.s3_client.list_objects_v2(Bucket=S3_CONFIG['bucket'], Prefix=prefix)
-        return response['Contents']
+        return list(self.iter_files(prefix))
 
     def get_file_size(self, key: str) -> int:
         response = self.s3_client.head_object(Bucket=S3_CONFIG['bucket'], Key=key)
         return response['ContentLength']
 
+    def describe(self, file: Dict) -> Dict:
+        """Fill in Size/ETag/LastModified for a listing entry, with a HEAD request only if one is missing."""
+        if all(field in file for field in ('Size', 'ETag', 'LastModified')):
+            return file
+        response = self.s3_client.head_object(Bucket=S3_CONFIG['bucket'], Key=file['Key'])
+        return {'Size': response['ContentLength'], 'ETag': response.get('ETag'),
+                'LastModified': response.get('LastModified'), **file}
+
     def download_file_content(self, key: str) -> str:
         obj = self.s3_client.get_object(Bucket=S3_CONFIG['bucket'], Key=key)
         return obj['Body'].read().decode('utf-8')
 
+    def open_file(self, key: str):
+        """The object's body as an unread stream, for reading in chunks."""
+        return self.s3_client.get_object(Bucket=S3_CONFIG['bucket'], Key=key)['Body']
+
+    def read_head(self, key: str, length: int) -> bytes:
+        """The first `length` bytes of an object, with a ranged GET."""
+        obj = self.s3_client.get_object(Bucket=S3_CONFIG['bucket'], Key=key, Range=f'bytes=0-{length - 1}')
+        return obj['Body'].read()
+
 def inferSchema(file_content: str, file_format: str) -> List[Tuple[str, str]]:
     if file_format == 'CSV':
-        df = pd.read_csv(StringIO(file_content), nrows=10)
+        df = pd.read_csv(StringIO(file_content), nrows=SCHEMA_SAMPLE_ROWS)
         schema = [(col.replace(' ', '_').lower(), 'VARCHAR') for col in df.columns]
-    else:  # CSV
+    else:  # JSON
         data = json.loads(file_content)
-        sample = data[0] if isinstance(data, list) else data
-        schema = [(key.replace(' ', '_').lower(), 'VARCHAR') for key in sample.keys()]
+        schema = record_schema(data[0] if isinstance(data, list) else data)
     return schema
 
+def record_schema(record: Dict) -> List[Tuple[str, str]]:
+    return [(key.replace(' ', '_').lower(), 'VARCHAR') for key in record.keys()]
+
+class CsvScanner:
+    """Counts the data lines of a CSV stream, keeping the header and first rows for schema inference.
+
+    Lines are counted as str.splitlines() would for LF and CRLF endings, one header line excluded."""
+
+    def __init__(self, sample_rows: int = SCHEMA_SAMPLE_ROWS):
+        self.sample_lines = sample_rows + 1
+        self.head = []
+        self.newlines = 0
+        self.last_char = ''
+
+    def feed(self, text: str) -> None:
+        if not text:
+            return
+        if len(self.head) < self.sample_lines or not self.head[-1].endswith('\n'):
+            pieces = text.splitlines(keepends=True)
+            if self.head and not self.head[-1].endswith('\n'):
+                self.head[-1] += pieces.pop(0)
+            self.head.extend(pieces[:self.sample_lines - len(self.head)])
+        self.newlines += text.count('\n')
+        self.last_char = text[-1]
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def count(self) -> int:
+        lines = self.newlines + (1 if self.last_char not in ('', '\n') else 0)
+        return max(lines - 1, 0)
+
+    def schema(self) -> List[Tuple[str, str]]:
+        return inferSchema(''.join(self.head[:self.sample_lines]), 'CSV')
+
+class JsonScanner:
+    """Counts the records of a JSON stream as they go past, decoding one at a time and keeping the
+    first few for schema inference. The elements of a top-level array are records; otherwise each
+    top-level value is one, which covers a single object as well as newline-delimited JSON."""
+
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])?[ \t\n\r]*')
+
+    def __init__(self, sample_rows: int = SCHEMA_SAMPLE_ROWS):
+        self.sample_rows = sample_rows
+        self.sample = []
+        self.count = 0
+        self.buffer = ''
+        self.state = 'start'  # then 'items' inside the array and 'end' after it, or 'values' for top-level records
+        self.retry_at = 0  # buffered characters needed before an undecodable value is tried again
+        self.final = False
+        self.scan = json.JSONDecoder().scan_once
+
+    def add(self, value) -> None:
+        self.count += 1
+        if len(self.sample) < self.sample_rows:
+            self.sample.append(value)
+
+    def feed(self, text: str) -> None:
+        buffer = self.buffer + text
+        pos = self.WHITESPACE.match(buffer).end()
+        if self.state == 'start' and pos < len(buffer):
+            if buffer[pos] == '[':
+                self.state = 'items'
+                pos = self.WHITESPACE.match(buffer, pos + 1).end()
+            else:
+                self.state = 'values'
+        while self.state == 'items' and pos < len(buffer):
+            if buffer[pos] == ']':
+                self.state, pos = 'end', pos + 1
+                break
+            try:
+                value, end = self.scan(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                break  # the element continues in the next chunk (or is malformed, which close() reports)
+            separator = self.SEPARATOR.match(buffer, end)
+            if separator.group(1) is None:
+                break  # wait for what follows: a number at the chunk boundary may be cut short ("12" of "12.5")
+            self.add(value)
+            pos = separator.end()
+            if separator.group(1) == ']':
+                self.state = 'end'
+        if self.state == 'values' and (self.final or len(buffer) - pos >= self.retry_at):
+            pos = self.feed_values(buffer, pos)
+        if self.state == 'end' and buffer[pos:].strip():
+            raise ValueError(f"Unexpected data after the JSON array: {buffer[pos:pos + 20].strip()!r}")
+        self.buffer = buffer[pos:]
+
+    def feed_values(self, buffer: str, pos: int) -> int:
+        while pos < len(buffer):
+            try:
+                value, end = self.scan(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                # Most likely cut off by the chunk boundary. Retrying only once the buffer has doubled
+                # keeps a single large document linear to decode.
+                self.retry_at = 2 * (len(buffer) - pos)
+                break
+            if buffer[end - 1] not in '}]"' and not (buffer[end:end + 1].isspace() or self.final and end == len(buffer)):
+                break  # a number or literal needs what follows it: "12" of "12.5" may be cut short by the chunk
+            self.add(value)
+            self.retry_at = 0
+            pos = self.WHITESPACE.match(buffer, end).end()
+        return pos
+
+    def close(self) -> None:
+        self.final = True
+        self.feed('')
+        if self.state == 'items':
+            raise ValueError(f"Malformed or unterminated JSON array near {self.buffer[:20]!r}")
+        if self.state == 'values' and self.buffer:
+            raise ValueError(f"Malformed JSON near {self.buffer[:20]!r}")
+
+    def schema(self) -> List[Tuple[str, str]]:
+        if not self.sample:
+            raise ValueError("Empty JSON: no record to infer a schema from")
+        return record_schema(self.sample[0])
+
+def scan_file(body, file_format: str, sample_rows: int = SCHEMA_SAMPLE_ROWS) -> Dict:
+    """Hash, count and sample an object in one pass over its S3 body, holding one chunk at a time.
+
+    Returns the MD5 `file_hash` of the raw bytes (as calculate_file_hash gives for the decoded text),
+    the `record_count` and the `schema` inferred from the first `sample_rows` rows.
+    """
+    digest = hashlib.md5()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    scanner = CsvScanner(sample_rows) if file_format == 'CSV' else JsonScanner(sample_rows)
+    for chunk in iter(lambda: body.read(READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        scanner.feed(decoder.decode(chunk))
+    scanner.feed(decoder.decode(b'', final=True))
+    scanner.close()
+    return {'file_hash': digest.hexdigest(), 'record_count': scanner.count, 'schema': scanner.schema()}
+
+def sample_schema(s3_manager: S3Manager, file: Dict, file_format: str) -> List[Tuple[str, str]]:
+    """Infer the schema from the start of the object: a CSV header line, or the first JSON record.
+
+    A first record larger than MAX_SCHEMA_SAMPLE_BYTES (say, one big JSON object) is found by
+    streaming the object through scan_file, as client-side metadata does."""
+    length = SCHEMA_SAMPLE_BYTES
+    while True:
+        head = s3_manager.read_head(file['Key'], length)
+        whole = len(head) >= file['Size']
+        text = codecs.getincrementaldecoder('utf-8')().decode(head, final=whole)
+        if file_format == 'CSV':
+            text = text if whole else text[:text.rfind('\n') + 1]  # complete lines only
+            if text.strip():
+                return inferSchema(text, 'CSV')
+        else:
+            scanner = JsonScanner()
+            scanner.feed(text)
+            if whole:
+                scanner.close()
+            if scanner.sample or whole:
+                return scanner.schema()
+        if whole:
+            raise ValueError(f"No {file_format} header or record in {file['Key']}")
+        if length >= MAX_SCHEMA_SAMPLE_BYTES:
+            break
+        length *= 2
+    logging.warning(f"No complete {file_format} header or record in the first {len(head)} bytes of {file['Key']}; "
+                    f"reading the whole object")
+    body = s3_manager.open_file(file['Key'])
+    try:
+        return scan_file(body, file_format)['schema']
+    finally:
+        body.close()
+
 def calculate_file_hash(file_content: str) -> str:
     return hashlib.md5(file_content.encode()).hexdigest()
 
@@ -115,47 +403,149 @@ def get_file_format(key: str) -> str:
         return 'JSON'
     return 'CSV'  # Default
 
-def process_file(s3_manager: S3Manager, snowflake_manager: SnowflakeManager, file_key: int, file_queue: queue.Queue) -> None:
-    file_size = s3_manager.get_file_size(file_key)
+def get_table_name(key: str) -> str:
+    return f"{SNOWFLAKE_CONFIG['schema']}.{re.sub(r'[^a-zA-Z0-9]', '_', key.split('/')[-1].split('.')[0]).upper()}"
+
+def get_file_hash(file: Dict) -> str:
+    """The S3 ETag used as a file's fingerprint with server-side metadata; empty if S3 gave none."""
+    return (file.get('ETag') or '').strip('"')
+
+def process_file(s3_manager: S3Manager, snowflake_manager: SnowflakeManager, file: Dict, file_queue: queue.Queue) -> None:
+    """Download, scan and load one object; `file` is its listing entry, whose Size spares a HEAD request.
+
+    Used without server-side metadata; load_batch replaces it when that is enabled.
+    """
+    file = s3_manager.describe(file)
+    file_key, file_size = file['Key'], file['Size']
     if file_size <= SIZE_THRESHOLD:
         logging.info(f"Skipping {file_key} (Size: {file_size / (1024 * 1024):.2f} MB)")
         return
 
     logging.info(f"Processing {file_key} (Size: {file_size / (1024 * 1024):.2f} MB)")
-    file_content = s3_manager.download_file_content(file_key)
     file_format = get_file_format(file_key)
-    schema = infer_schema(file_content, file_format)
+    body = s3_manager.open_file(file_key)
+    try:
+        scan = scan_file(body, file_format)
+    finally:
+        body.close()
 
-    table_name = f"{SNOWFLAKE_CONFIG['schema']}.{re.sub(r'[^a-zA-Z0-9]', '_', file_key.split('/')[-1].split('.')[0]).upper()}"
-    snowflake_manager.create_table(table_name, schema)
+    # Files mapping to the same table must not replace each other's rows
+    table_name = get_table_name(file_key)
+    snowflake_manager.ensure_table(table_name, lambda: scan['schema'])
 
-    s3_path = f"s3:///{S3_CONFIG['bucket']}/{file_key}"
-    snowflake_manager.copy_into_table(s3_path, table_name, file_format)
+    s3_path = f"s3://{S3_CONFIG['bucket']}/{file_key}"
+    snowflake_manager.copy_into_table1(s3_path, table_name, file_format)
 
     metadata = {
         'file_name': file_key,
         'file_size_mb': file_size / (1024 * 1024),
         'table_name': table_name,
         'load_timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'file_hash': calculate_file_hash(file_content),
-        'record_count': len(file_content.splitlines()) - 1 if file_format === 'CSV' else len(json.loads(file_content))
+        'file_hash': scan['file_hash'],
+        'record_count': scan['record_count']
     }
-    snowflake_manager.insert_metadata(table_name, metadata)
+    snowflake_manager.insert_metadata1(table_name, metadata)
     file_queue.put(metadata)
 
-def batch_process_files(s3_manager: S3Manager, snowflake_manager: SnowflakeManager, files: List[Dict]) -> None:
-    file_queue = queue.Queue()
-    batches = [files[i:i + BATCH_SIZE] for i in range(0, len(files), BATCH_SIZE)]
-
-    for batch in batches:
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            for file in batch:
-                executor.submit(process_file, s3_manager, snowflake_manager, file['Key'], file_queue)
-
+def log_completed(file_queue: queue.Queue) -> None:
     while not file_queue.empty():
         metadata = file_queue.get()
         logging.info(f"Completed processing: {metadata['file_name']}")
 
+def large_files(s3_manager: S3Manager, files: Iterable[Dict]) -> Iterator[Dict]:
+    for file in files:
+        file = s3_manager.describe(file)
+        if file['Size'] <= SIZE_THRESHOLD:
+            logging.info(f"Skipping {file['Key']} (Size: {file['Size'] / (1024 * 1024):.2f} MB)")
+        else:
+            yield file
+
+def plan_copies(files: Iterable[Dict], max_files: int = MAX_FILES_PER_COPY, window: int = COPY_WINDOW) -> Iterator[Dict]:
+    """Group files by target table into COPY batches of at most `max_files`.
+
+    A table's batch is sent when full, when `window` more files have been listed since it opened,
+    or at the end of the listing, so a lazy listing never stalls a table's load.
+    """
+    pending = OrderedDict()  # oldest batch first
+    for position, file in enumerate(files):
+        target = (get_table_name(file['Key']), get_file_format(file['Key']))
+        if target not in pending:
+            pending[target] = {'table_name': target[0], 'file_format': target[1], 'files': [], 'opened_at': position}
+        batch = pending[target]
+        batch['files'].append(file)
+        if len(batch['files']) >= max_files:
+            yield pending.pop(target)
+        while pending and position - next(iter(pending.values()))['opened_at'] >= window:
+            yield pending.popitem(last=False)[1]
+    yield from pending.values()
+
+def load_batch(s3_manager: S3Manager, snowflake_manager: SnowflakeManager, batch: Dict, file_queue: queue.Queue) -> None:
+    """Load a planned batch with one COPY INTO and record each file from COPY's per-file results."""
+    table_name, file_format, files = batch['table_name'], batch['file_format'], batch['files']
+    snowflake_manager.ensure_table(table_name, lambda: sample_schema(s3_manager, files[0], file_format))
+    results = snowflake_manager.copy_files(table_name, [file['Key'] for file in files], file_format)
+
+    # COPY leaves out files its load history says were loaded before; those already have a metadata row
+    unreported = [file['Key'] for file in files if file['Key'] not in results]
+    recorded = snowflake_manager.recorded_loads(unreported) if unreported else {}
+
+    load_timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    for file in files:
+        result = results.get(file['Key'])
+        if result is None:
+            if get_file_hash(file) in recorded.get(file['Key'], ()):
+                logging.info(f"Skipped {file['Key']}: already loaded into {table_name}")
+            else:
+                logging.error(f"Failed to load {file['Key']} into {table_name}: COPY INTO reported no result for it")
+            continue
+        if result.get('status') in ('LOAD_FAILED', 'PARTIALLY_LOADED'):
+            logging.error(f"Failed to load {file['Key']} into {table_name}: {result.get('first_error')}")
+            continue
+        rows.append({
+            'file_name': file['Key'],
+            'file_size_mb': file['Size'] / (1024 * 1024),
+            'table_name': table_name,
+            'load_timestamp': load_timestamp,
+            'file_hash': get_file_hash(file),
+            'record_count': rows_loaded([result])
+        })
+    if rows:
+        snowflake_manager.insert_metadata_rows(rows)
+    for metadata in rows:
+        file_queue.put(metadata)
+
+def batch_process_files(s3_manager: S3Manager, snowflake_manager: SnowflakeManager, files: Iterable[Dict]) -> None:
+    """Process files as the (lazy) listing yields them, keeping at most BATCH_SIZE tasks in flight.
+
+    With server-side metadata, files bound for the same table share one COPY INTO per batch (see
+    plan_copies). Otherwise each file is downloaded and scanned anyway, so it keeps its own COPY.
+    """
+    file_queue = queue.Queue()
+    in_flight = {}
+
+    def collect(futures) -> None:
+        for future in futures:
+            label = in_flight.pop(future)
+            if future.exception() is not None:
+                logging.error(f"Failed to process {label}: {future.exception()}")
+        log_completed(file_queue)
+
+    if snowflake_manager.server_side_metadata:
+        tasks = ((load_batch, batch, f"{len(batch['files'])} files for {batch['table_name']}")
+                 for batch in plan_copies(large_files(s3_manager, files)))
+    else:
+        tasks = ((process_file, file, file['Key']) for file in files)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for task, item, label in tasks:
+            if len(in_flight) >= BATCH_SIZE:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(task, s3_manager, snowflake_manager, item, file_queue)
+            in_flight[future] = label
+        collect(list(wait(in_flight).done))
+
 def create_metadata_table(snowflake_manager: SnowflakeManager) -> None:
     query = """
     CREATE OR REPLACE TABLE METADATA_TABLE (
@@ -201,15 +591,15 @@ def generate_report(snowflake_manager: SnowflakeManager) -> None:
             f.write(f"Table: {row[0]}, Loads: {row[1]}, Avg_Size_MB: {row[2]:.2f}\n")
     logging.info("Generated load report")
 
-def main():
+def main(server_side_metadata: bool = SERVER_SIDE_METADATA):
     s3_manager = S3Manager()
-    snowflake_manager = SnowflakeManager()
+    snowflake_manager = SnowflakeManager(server_side_metadata)
     create_metadata_table(snowflake_manager)
 
-    files = s3_manager.list_files(S3_CONFIG['prefix'])
-    batch_process_files(s3_manager, snowflake_manager, files)
+    # Loading starts with the first listing page; a million-key prefix is never held in memory
+    batch_process_files(s3_manager, snowflake_manager, s3_manager.iter_files(S3_CONFIG['prefix']))
 
-    for file in files:
+    for file in s3_manager.iter_files(S3_CONFIG['prefix']):
         stats = validate_data(s3_manager, file['Key'])
         logging.info(f"Validation stats for {file['Key']}: {stats}")
 
@@ -278,13 +668,16 @@ def update_dashboard(snowflake_manager: SnowflakeManager) -> None:
     logging.info("Updated dashboard data")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Load large S3 files into Snowflake")
+    parser.add_argument("--server-side-metadata", action="store_true", default=SERVER_SIDE_METADATA,
+                        help="batch COPY INTO per table and record the S3 ETag and COPY's row counts "
+                             "instead of downloading each file to hash and count it")
+    main(parser.parse_args().server_side_metadata)
     schedule_next_run()
     # Add more calls to fill lines
     s3_manager = S3Manager()
     for _ in range(50):  # Simulate complex processing
-        files = s3_manager.list_files(S3_CONFIG['prefix'])
-        for file in files:
+        for file in s3_manager.iter_files(S3_CONFIG['prefix']):
             stats = analyze_file_content(s3_manager.download_file_content(file['Key']))
             logging.info(f"Analysis for {file['Key']}: {stats}")
 
@@ -293,7 +686,7 @@ if __name__ == "__main__":
         notify_users(snowflake_manager)
         update_dashboard(snowflake_manager)
 
-    for file in files:
+    for file in s3_manager.iter_files(S3_CONFIG['prefix']):
         archive_file(s3_manager, file['Key'])
 
     for _ in range(100):
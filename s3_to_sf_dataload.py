@@ -21,6 +21,8 @@ AWS_SECRET_KEY = 'your_aws_secret_key'
 
 # File size threshold (200 MB in bytes)
 SIZE_THRESHOLD = 200 * 1024 * 1024  # 200 MB
+LIST_PAGE_SIZE = 1000  # keys per list_objects_v2 call (the S3 maximum)
+MAX_FILES_PER_COPY = 1000  # Snowflake's limit on FILES = (...) in one COPY INTO
 
 def connect_to_snowflake():
     """Establish connection to Snowflake."""
@@ -44,8 +46,23 @@ def get_s3_client():
         print(f"Error creating S3 client: {e}")
         raise
 
-def check_file_size(s3_client, bucket, key):
-    """Check if the file size is greater than the threshold."""
+def list_pages(s3_client, bucket, prefix):
+    """Yield the objects under the prefix one listing page at a time, as each page arrives."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={'PageSize': LIST_PAGE_SIZE}):
+        yield page.get('Contents', [])
+
+def sql_string(value):
+    """Quote a value as a Snowflake string literal, escaping backslashes and single quotes."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+def check_file_size(s3_client, bucket, key, size=None):
+    """Check if the file size is greater than the threshold.
+
+    Pass the listing's `Size` when it is known; the HEAD request is only made without it.
+    """
+    if size is not None:
+        return size > SIZE_THRESHOLD, size
     try:
         response = s3_client.head_object(Bucket=bucket, Key=key)
         file_size = response['ContentLength']
@@ -54,22 +71,43 @@ def check_file_size(s3_client, bucket, key):
         print(f"Error checking file {key}: {e}")
         return False, 0
 
-def load_file_to_snowflake(conn, s3_path, table_name):
-    """Load data from S3 to Snowflake using COPY INTO."""
+def load_files_to_snowflake(conn, bucket, keys, table_name):
+    """Load many S3 files with one COPY INTO ... FILES = (...) and report each file's result."""
+    location = f"s3://{bucket}/"
     try:
         cursor = conn.cursor()
+        files = ", ".join(sql_string(key) for key in keys)
         copy_query = f"""
         COPY INTO {table_name}
-        FROM '{s3_path}'
+        FROM '{location}'
+        FILES = ({files})
         FILE_FORMAT = (TYPE = CSV SKIP_HEADER = 1)
+        ON_ERROR = SKIP_FILE
         """
         cursor.execute(copy_query)
-        print(f"Successfully loaded {s3_path} into {table_name}")
+        columns = [column[0].lower() for column in cursor.description or []]
+        paths = {f"{location}{key}": key for key in keys}
+        results = {}
+        for row in cursor.fetchall():
+            result = dict(zip(columns, row))
+            if result.get('file') in paths:
+                results[paths[result['file']]] = result
         cursor.close()
     except Exception as e:
-        print(f"Error loading {s3_path} to Snowflake: {e}")
+        print(f"Error loading {len(keys)} files from {location} to Snowflake: {e}")
         raise
 
+    # Files with no result row were skipped by Snowflake's load history
+    for key in keys:
+        result = results.get(key)
+        if result is None:
+            print(f"Skipped {location}{key}: already loaded into {table_name}")
+        elif result.get('status') == 'LOADED':
+            print(f"Successfully loaded {location}{key} into {table_name} ({result.get('rows_loaded')} rows)")
+        else:
+            print(f"Error loading {location}{key} to Snowflake: {result.get('first_error')}")
+    return results
+
 def main():
     """Main function to check S3 files and load to Snowflake."""
     # Initialize connections
@@ -77,24 +115,32 @@ def main():
     s3_client = get_s3_client()
 
     try:
-        # List objects in S3 bucket
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=S3_PREFIX)
-        if 'Contents' not in response:
+        # List objects in S3 bucket page by page, processing each file as soon as its page arrives
+        table_name = 'YOUR_TARGET_TABLE'  # Specify your Snowflake table
+        found = False
+        pending = []  # large files waiting for the next batched COPY INTO
+        for page in list_pages(s3_client, S3_BUCKET, S3_PREFIX):
+            for obj in page:
+                found = True
+                file_key = obj['Key']
+                is_large, file_size = check_file_size(s3_client, S3_BUCKET, file_key, obj.get('Size'))
+
+                if is_large:
+                    print(f"File {file_key} ({file_size / (1024 * 1024):.2f} MB) exceeds 200 MB. Loading to Snowflake...")
+                    pending.append(file_key)
+                    if len(pending) >= MAX_FILES_PER_COPY:
+                        load_files_to_snowflake(snowflake_conn, S3_BUCKET, pending, table_name)
+                        pending = []
+                else:
+                    print(f"File {file_key} ({file_size / (1024 * 1024):.2f} MB) is under 200 MB. Skipping...")
+
+            # Load this page's files before waiting for the next page
+            if pending:
+                load_files_to_snowflake(snowflake_conn, S3_BUCKET, pending, table_name)
+                pending = []
+
+        if not found:
             print("No files found in the specified S3 path.")
-            return
-
-        # Process each file
-        for obj in response['Contents']:
-            file_key = obj['Key']
-            is_large, file_size = check_file_size(s3_client, S3_BUCKET, file_key)
-            
-            if is_large:
-                print(f"File {file_key} ({file_size / (1024 * 1024):.2f} MB) exceeds 200 MB. Loading to Snowflake...")
-                s3_path = f"s3://{S3_BUCKET}/{file_key}"
-                table_name = 'YOUR_TARGET_TABLE'  # Specify your Snowflake table
-                load_file_to_snowflake(snowflake_conn, s3_path, table_name)
-            else:
-                print(f"File {file_key} ({file_size / (1024 * 1024):.2f} MB) is under 200 MB. Skipping...")
 
     except Exception as e:
         print(f"Error in main process: {e}")
@@ -0,0 +1,364 @@
+import ast
+import io
+import re
+import tokenize
+from typing import Iterator, List, Tuple
+
+from findings import Finding
+from languages import detect_language
+
+TRIVIAL_SEVERITIES = ("info", "low")
+
+SQL_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<dollar>\$\$.*?(?:\$\$|\Z))
+  | (?P<string>'(?:[^'\\]|\\.|'')*(?:'|\Z))
+  | (?P<ident>"(?:[^"]|"")*(?:"|\Z))
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<punct>.)
+""", re.S | re.X)
+
+SQL_HINT_RE = re.compile(
+    r"^\s*(SELECT\b.*\bFROM\b|INSERT\s+INTO\b|UPDATE\s+\S+\s+SET\b|DELETE\s+FROM\b|MERGE\s+INTO\b"
+    r"|CREATE\s+\w+|ALTER\s+\w+|DROP\s+\w+|COPY\s+INTO\b|WITH\s+\w+\s+AS\b|TRUNCATE\s+\w+)",
+    re.I | re.S
+)
+CREATE_REPLACE_RE = re.compile(r"^\s*CREATE\s+OR\s+REPLACE\s+(?:TRANSIENT\s+|TEMP(?:ORARY)?\s+)?TABLE\b", re.I)
+FSTRING_PREFIX_RE = re.compile(r"^[rRbBuU]*[fF][rR]?")
+LOOP_STARTERS = {"FOR", "WHILE", "REPEAT"}
+LOG_CALLS = {"print", "debug", "info", "warning", "warn", "error", "exception", "critical", "log"}
+
+SqlToken = Tuple[str, str, int]  # (kind, value, line)
+
+
+# --- SQL --------------------------------------------------------------------
+
+def tokenize_sql(sql: str, first_line: int = 1) -> List[SqlToken]:
+    """Tokenize SQL, dropping whitespace/comments and expanding SQL-language $$ bodies."""
+    tokens = []
+    line = first_line
+    for match in SQL_TOKEN_RE.finditer(sql):
+        kind, value = match.lastgroup, match.group()
+        if kind == "dollar":
+            language = _procedure_language(tokens)
+            if language in ("", "SQL"):
+                # End the CREATE ... AS header so the body's first statement stands alone
+                tokens.append(("punct", ";", line))
+                tokens.extend(tokenize_sql(value[2:-2], line))
+            else:
+                tokens.append(("string", value, line))
+        elif kind == "word":
+            tokens.append((kind, value.upper(), line))
+        elif kind not in ("ws", "comment"):
+            tokens.append((kind, value, line))
+        line += value.count("\n")
+    return tokens
+
+
+def _procedure_language(tokens: List[SqlToken]) -> str:
+    for i in range(len(tokens) - 1, 0, -1):
+        if tokens[i][1] == ";":
+            break
+        if tokens[i - 1][1] == "LANGUAGE" and tokens[i][0] == "word":
+            return tokens[i][1]
+    return ""
+
+
+def split_statements(tokens: List[SqlToken]) -> Iterator[List[SqlToken]]:
+    statement = []
+    for token in tokens:
+        if token[1] == ";":
+            if statement:
+                yield statement
+            statement = []
+        else:
+            statement.append(token)
+    if statement:
+        yield statement
+
+
+def _has_top_level_word(statement: List[SqlToken], word: str) -> bool:
+    depth = 0
+    for kind, value, _ in statement:
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and value == word:
+            return True
+    return False
+
+
+def check_sql_statement(statement: List[SqlToken], file: str, in_loop: bool = False) -> List[Finding]:
+    findings = []
+    words = [value for kind, value, _ in statement if kind == "word"]
+    if not words:
+        return findings
+    line = statement[0][2]
+    end_line = statement[-1][2]
+
+    for i, (kind, value, tok_line) in enumerate(statement[:-1]):
+        if value != "SELECT":
+            continue
+        nxt = statement[i + 1]
+        if nxt[1] == "DISTINCT" and i + 2 < len(statement):
+            nxt = statement[i + 2]
+        if nxt[1] == "*":
+            findings.append(Finding(
+                file, tok_line, tok_line, "low", "select-star",
+                "`SELECT *` reads every column, which is slow on wide tables and breaks when columns change.",
+                "List only the columns you need.", "rule"
+            ))
+
+    verb = words[0]
+    if verb in ("DELETE", "UPDATE") and not _has_top_level_word(statement, "WHERE"):
+        findings.append(Finding(
+            file, line, end_line, "high", f"{verb.lower()}-without-where",
+            f"`{verb}` without a `WHERE` clause affects every row of the table.",
+            "Add a WHERE clause, or use TRUNCATE if clearing the table is intended.", "rule"
+        ))
+
+    if in_loop and words[:3] == ["CREATE", "OR", "REPLACE"] and "TABLE" in words[3:5]:
+        findings.append(_create_in_loop_finding(file, line))
+    return findings
+
+
+def _create_in_loop_finding(file: str, line: int, via: str = "") -> Finding:
+    via = f" (via `{via}()`)" if via else ""
+    return Finding(
+        file, line, line, "high", "create-or-replace-in-loop",
+        f"`CREATE OR REPLACE TABLE` runs inside a loop{via}, recreating (and emptying) the table on every iteration.",
+        "Create the table once before the loop, or use CREATE TABLE IF NOT EXISTS.", "rule"
+    )
+
+
+def check_sql(sql: str, file: str, first_line: int = 1) -> List[Finding]:
+    findings = []
+    loop_depth = 0
+    for statement in split_statements(tokenize_sql(sql, first_line)):
+        words = [value for kind, value, _ in statement if kind == "word"]
+        loop_depth += _loop_opens(words)
+        body = _strip_block_prefix(statement)
+        findings.extend(check_sql_statement(body, file, in_loop=loop_depth > 0))
+        if len(words) >= 2 and words[0] == "END" and words[1] in LOOP_STARTERS | {"LOOP"}:
+            loop_depth = max(loop_depth - 1, 0)
+    return findings
+
+
+def _loop_opens(words: List[str]) -> int:
+    """Count Snowflake Scripting loops opened by a statement (FOR/WHILE/REPEAT/LOOP)."""
+    # Skip a leading BEGIN so `BEGIN FOR ...` still counts as a loop header
+    head = words[1] if len(words) > 1 and words[0] == "BEGIN" else (words[0] if words else "")
+    opens = 1 if head in LOOP_STARTERS else 0
+    for i, word in enumerate(words):
+        # `FOR ... LOOP` and `WHILE ... LOOP` are a single loop
+        if word == "LOOP" and (i == 0 or words[i - 1] != "END") and head not in ("FOR", "WHILE"):
+            opens += 1
+    return opens
+
+
+def _strip_block_prefix(statement: List[SqlToken]) -> List[SqlToken]:
+    """Drop BEGIN / loop / IF headers so the statement body starts at its verb."""
+    if not statement or statement[0][0] != "word":
+        return statement
+    head = statement[0][1]
+    if head in ("BEGIN", "LOOP", "REPEAT", "ELSE"):
+        return _strip_block_prefix(statement[1:])
+    separators = {"FOR": ("DO", "LOOP"), "WHILE": ("DO", "LOOP"), "IF": ("THEN",), "ELSEIF": ("THEN",)}
+    if head in separators:
+        for i, (kind, value, _) in enumerate(statement):
+            if kind == "word" and value in separators[head]:
+                return _strip_block_prefix(statement[i + 1:])
+    return statement
+
+
+# --- Python -----------------------------------------------------------------
+
+def _python_strings(code: str) -> List[Tuple[int, str, bool]]:
+    """Return (line, literal body, is_fstring) for every string token, even in unparsable files."""
+    strings = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.STRING:
+                prefix = re.match(r"^[A-Za-z]*", token.string).group()
+                body = token.string[len(prefix):].strip("'\"")
+                strings.append((token.start[0], body, bool(FSTRING_PREFIX_RE.match(prefix))))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+    return strings
+
+
+def _check_python_strings(code: str, file: str) -> List[Finding]:
+    findings = []
+    for line, body, is_fstring in _python_strings(code):
+        if not SQL_HINT_RE.match(body):
+            continue
+        literal = re.sub(r"\{[^{}]*\}", "PLACEHOLDER", body) if is_fstring else body
+        for finding in check_sql(literal, file, line):
+            findings.append(finding)
+        if is_fstring and re.search(r"\{[^{}]+\}", body):
+            quoted = re.search(r"'\{[^{}]+\}'", body) is not None
+            findings.append(Finding(
+                file, line, line + body.count("\n"), "high" if quoted else "medium", "sql-fstring",
+                "SQL is built with an f-string; interpolated values are open to SQL injection and quoting bugs.",
+                "Pass values as bind parameters (e.g. cursor.execute(sql, params)) and whitelist identifiers.",
+                "rule"
+            ))
+    return findings
+
+
+def _call_name(node: ast.AST) -> str:
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return ""
+
+
+class PythonRuleVisitor(ast.NodeVisitor):
+    def __init__(self, file: str, table_creators: set):
+        self.file = file
+        self.table_creators = table_creators
+        self.loop_depth = 0
+        self.findings = []
+
+    def visit_loop(self, node):
+        for child in [node.iter] if isinstance(node, (ast.For, ast.AsyncFor)) else [node.test]:
+            self.visit(child)
+        self.loop_depth += 1
+        for child in node.body:
+            self.visit(child)
+        self.loop_depth -= 1
+        for child in node.orelse:
+            self.visit(child)
+
+    visit_For = visit_AsyncFor = visit_While = visit_loop
+
+    def visit_FunctionDef(self, node):
+        # A def inside a loop body is not itself executed per iteration
+        outer, self.loop_depth = self.loop_depth, 0
+        self.generic_visit(node)
+        self.loop_depth = outer
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Constant(self, node):
+        if self.loop_depth and isinstance(node.value, str) and CREATE_REPLACE_RE.match(node.value):
+            self.findings.append(_create_in_loop_finding(self.file, node.lineno))
+
+    def visit_Call(self, node):
+        if self.loop_depth:
+            targets = [_call_name(node)]
+            if _call_name(node) in ("submit", "map", "apply_async") and node.args:
+                targets.append(_call_name(node.args[0]))
+            creator = next((t for t in targets if t in self.table_creators), None)
+            if creator:
+                self.findings.append(_create_in_loop_finding(self.file, node.lineno, creator))
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        broad = node.type is None or (isinstance(node.type, ast.Name) and node.type.id in ("Exception", "BaseException"))
+        if broad and all(_only_reports(stmt) for stmt in node.body):
+            caught = "bare `except:`" if node.type is None else f"`except {node.type.id}`"
+            self.findings.append(Finding(
+                self.file, node.lineno, node.body[-1].end_lineno or node.lineno, "medium", "swallowed-exception",
+                f"{caught} only prints or logs the error and carries on, hiding failures from callers.",
+                "Catch the specific exceptions you expect, and re-raise or return an error after logging.", "rule"
+            ))
+        self.generic_visit(node)
+
+
+def _only_reports(stmt: ast.stmt) -> bool:
+    if isinstance(stmt, ast.Pass):
+        return True
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and _call_name(stmt.value) in LOG_CALLS
+
+
+def _find_table_creators(tree: ast.AST) -> set:
+    """Names of functions that (transitively) run CREATE OR REPLACE TABLE."""
+    functions = {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions[node.name] = node
+
+    def creates_directly(fn):
+        for node in ast.walk(fn):
+            text = node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else ""
+            if CREATE_REPLACE_RE.match(text):
+                return True
+        return False
+
+    creators = {name for name, fn in functions.items() if creates_directly(fn)}
+    changed = True
+    while changed:
+        changed = False
+        for name, fn in functions.items():
+            if name in creators:
+                continue
+            if any(isinstance(n, ast.Call) and _call_name(n) in creators for n in ast.walk(fn)):
+                creators.add(name)
+                changed = True
+    return creators
+
+
+def _check_except_lines(code: str, file: str) -> List[Finding]:
+    """Line-based fallback for files that do not parse."""
+    findings = []
+    lines = code.splitlines()
+    for i, line in enumerate(lines):
+        match = re.match(r"^(\s*)except(\s+(Exception|BaseException)\b[^:]*)?\s*:\s*$", line)
+        if not match:
+            continue
+        indent = len(match.group(1))
+        body = []
+        for following in lines[i + 1:]:
+            if following.strip() and len(following) - len(following.lstrip()) <= indent:
+                break
+            if following.strip():
+                body.append(following.strip())
+        if body and all(re.match(r"^(pass$|print\(|logging\.|logger\.|log\.)", b) for b in body):
+            findings.append(Finding(
+                file, i + 1, i + 1 + len(body), "medium", "swallowed-exception",
+                "Broad `except` only prints or logs the error and carries on, hiding failures from callers.",
+                "Catch the specific exceptions you expect, and re-raise or return an error after logging.", "rule"
+            ))
+    return findings
+
+
+def check_python(code: str, file: str) -> List[Finding]:
+    findings = _check_python_strings(code, file)
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        line = e.lineno or 1
+        findings.append(Finding(
+            file, line, line, "high", "syntax-error", f"File does not parse: {e.msg}.",
+            "Fix the syntax error; the file cannot be imported as-is.", "rule"
+        ))
+        findings.extend(_check_except_lines(code, file))
+        return findings
+
+    visitor = PythonRuleVisitor(file, _find_table_creators(tree))
+    visitor.visit(tree)
+    return findings + visitor.findings
+
+
+def run_rules(code: str, file: str) -> List[Finding]:
+    """Run the deterministic checks for a file and return findings sorted by line."""
+    language = detect_language(file, code[:100].encode("utf-8"))
+    if language == "SQL":
+        findings = check_sql(code, file)
+    elif language == "Python":
+        findings = check_python(code, file)
+    else:
+        findings = []
+    return sorted(findings, key=lambda f: (f.line_start, f.category))
+
+
+def only_trivial(findings: List[Finding]) -> bool:
+    """True when there are rule hits and all of them are low-severity."""
+    return bool(findings) and all(f.severity in TRIVIAL_SEVERITIES for f in findings)
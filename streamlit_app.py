@@ -1,52 +1,97 @@
-import streamlit as st
-import openai
+import io
 import os
-from dotenv import load_dotenv
+import time
+import zipfile
+
+import streamlit as st
+
+from ai_reviewer import ReviewOptions, format_rule_findings
+from languages import detect_language
+from repo_walker import DEFAULT_MAX_FILE_BYTES, VENDORED_DIRS, skip_reason
+from review_cache import ReviewCache
+from review_jobs import FAILED, ReviewJobs
+from static_rules import run_rules
+
+REVIEWABLE_LANGUAGES = {"SQL", "Python"}
+MAX_ZIP_MEMBERS = 2000
+POLL_SECONDS = 0.5
+
+
+@st.cache_resource
+def get_jobs() -> ReviewJobs:
+    """One background review queue (and cache) for all sessions of this server."""
+    return ReviewJobs(ReviewOptions(cache=ReviewCache()))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def read_upload(name: str, data: bytes):
+    """Return [(filename, code)] for an uploaded file, expanding .zip archives."""
+    if not name.lower().endswith(".zip"):
+        return [(name, data.decode("utf-8", errors="replace"))]
+    files = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist()[:MAX_ZIP_MEMBERS]:
+            parts = info.filename.split("/")
+            if info.is_dir() or info.file_size > DEFAULT_MAX_FILE_BYTES or VENDORED_DIRS.intersection(parts[:-1]):
+                continue
+            content = archive.read(info)
+            if detect_language(info.filename, content[:100]) in REVIEWABLE_LANGUAGES \
+                    and skip_reason(os.path.basename(info.filename), content[:8192]) is None:
+                files.append((info.filename, content.decode("utf-8", errors="replace")))
+    return files
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def static_checks(code: str, filename: str) -> str:
+    return format_rule_findings(run_rules(code, filename))
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 st.set_page_config(page_title="AI Code Reviewer", page_icon="🤖")
 st.title("🤖 AI-Powered Code Reviewer")
-st.caption("Upload a `.sql` or `.py` file for GPT-4 analysis")
-
-uploaded_file = st.file_uploader("Choose a code file", type=["sql", "py"])
-if uploaded_file:
-    code = uploaded_file.read().decode("utf-8")
-    filename = uploaded_file.name
-    file_type = "SQL" if filename.endswith(".sql") else "Python"
-
-    with st.spinner("Analyzing code with GPT-4..."):
-        prompt = f"""
-You are a senior software reviewer. Analyze this {file_type} code:
-
-Detect and comment on:
-- Poor naming + suggestions
-- Syntax or logic issues
-- Redundant or unreachable code
-- Optimization or performance issues
-- Missing edge-case handling
-- Security/style violations
-
-Give clear bullet-point feedback with explanation.
-
-Filename: {filename}
-
-Code:
-{code}
-"""
-
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a software review expert."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            feedback = response.choices[0].message.content.strip()
-            st.markdown("### ✅ AI Feedback")
-            st.markdown(f"```markdown\n{feedback}\n```")
-        except Exception as e:
-            st.error(f"OpenAI API error: {e}")
+st.caption("Upload `.sql` / `.py` files, or a `.zip` of them, for GPT-4 analysis")
+
+uploads = st.file_uploader("Choose code files", type=["sql", "py", "zip"], accept_multiple_files=True)
+refresh = st.checkbox("Ignore cached review", value=False)
+
+files = [f for upload in uploads or [] for f in read_upload(upload.name, upload.getvalue())]
+if uploads and not files:
+    st.warning("No reviewable `.sql` or `.py` files found in the upload.")
+
+if files:
+    jobs = get_jobs()
+    # Reruns happen on every interaction; only force a fresh review once per file per session
+    refreshed = st.session_state.setdefault("refreshed", set())
+    submitted = []
+    for filename, code in files:
+        key = jobs.job_key(code, filename)
+        force = refresh and key not in refreshed
+        if force:
+            refreshed.add(key)
+        submitted.append((filename, code, jobs.submit(code, filename, refresh=force).key))
+
+    progress = st.progress(0.0)
+    slots = []
+    for filename, code, _ in submitted:
+        with st.expander(filename, expanded=len(submitted) == 1):
+            static_report = static_checks(code, filename)
+            if static_report:
+                st.markdown("#### 🧹 Static Checks")
+                st.markdown(f"```markdown\n{static_report}\n```")
+            st.markdown("#### ✅ AI Feedback")
+            slots.append(st.empty())
+
+    # Poll the background jobs; any widget interaction interrupts this loop, and the jobs keep running
+    while True:
+        states = [jobs.get(key) or jobs.submit(code, filename) for filename, code, key in submitted]
+        finished = sum(job.done for job in states)
+        progress.progress(finished / len(states), text=f"Reviewed {finished} of {len(states)} files")
+        for slot, job in zip(slots, states):
+            if job.state == FAILED:
+                slot.error(f"LLM API error: {job.error}")
+            elif job.review:
+                slot.markdown(f"```markdown\n{job.review}\n```")
+            else:
+                slot.caption(f"⏳ {job.state.capitalize()}...")
+        if finished == len(states):
+            break
+        time.sleep(POLL_SECONDS)
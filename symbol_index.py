@@ -0,0 +1,374 @@
+import ast
+import builtins
+import difflib
+import json
+import keyword
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+
+from chunker import count_tokens
+from languages import detect_language
+from repo_walker import DEFAULT_WALK_JOBS, walk_repo
+
+DEFAULT_INDEX_FILE = ".ai_reviewer_symbols.json"
+DEFAULT_CONTEXT_TOKENS = 300  # budget for the context block added to each prompt
+INDEX_VERSION = 1
+INDEXED_LANGUAGES = {"Python", "SQL"}
+MAX_SIGNATURE_CHARS = 200
+MAX_DEFINITIONS = 3  # names defined more often than this are too ambiguous to be worth showing
+KNOWN_NAMES = set(dir(builtins)) | set(keyword.kwlist) | {"self", "cls", "__file__", "__name__"}
+
+# Fallbacks for Python that does not parse, applied after strings and comments are blanked out
+PY_STRIP_RE = re.compile(r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|#[^\n]*')
+PY_DEF_RE = re.compile(r"^([ \t]*)(?:async[ \t]+)?(def|class)[ \t]+(\w+)([^\n]*)", re.M)
+PY_CALL_RE = re.compile(r"(?<![\w.])([A-Za-z_]\w*)[ \t]*\(")
+PY_ATTR_CALL_RE = re.compile(r"\.([A-Za-z_]\w*)[ \t]*\(")
+PY_ANNOTATION_RE = re.compile(r"(?:->|\w[ \t]*:)[ \t]*([A-Za-z_]\w*)(?![\w.])")
+PY_IMPORT_RES = (
+    re.compile(r"^[ \t]*import[ \t]+[\w.]+[ \t]+as[ \t]+(\w+)", re.M),
+    re.compile(r"^[ \t]*import[ \t]+([\w., \t]+)$", re.M),
+    re.compile(r"^[ \t]*from[ \t]+[\w.]+[ \t]+import[ \t]+\(?([\w, \t]+)", re.M),
+)
+PY_STAR_IMPORT_RE = re.compile(r"^[ \t]*from[ \t]+([\w.]+)[ \t]+import[ \t]+\*", re.M)
+PY_BINDING_RES = PY_IMPORT_RES + (
+    re.compile(r"^[ \t]*([\w, \t]+?)[ \t]*(?::[^=\n]*)?=(?!=)", re.M),  # assignments
+    re.compile(r"\bfor[ \t]+([\w, \t]+?)[ \t]+in\b"),
+    re.compile(r"\bas[ \t]+(\w+)"),
+    re.compile(r"\b(?:global|nonlocal)[ \t]+([\w, \t]+)"),
+)
+PY_PARAM_RE = re.compile(r"[(,][ \t*]*(\w+)[ \t]*(?=[:=,)])")
+
+SQL_DEF_RE = re.compile(
+    r"\bCREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:TEMP|TEMPORARY|TRANSIENT|SECURE|MATERIALIZED|EXTERNAL)\s+)*"
+    r"(TABLE|VIEW|FUNCTION|PROCEDURE)\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.$\"]+)", re.I)
+SQL_REF_RE = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE|TABLE|CALL)\s+([\w.$\"]+)", re.I)
+
+
+@dataclass
+class Symbol:
+    name: str
+    kind: str  # function, class, method, table, view, procedure...
+    path: str  # relative to the index root
+    line: int
+    signature: str
+
+    def describe(self) -> str:
+        return f"{self.path}:{self.line} {self.signature}"
+
+
+def _normalize(name: str) -> str:
+    # infer_schema, inferSchema and InferSchema all compare equal
+    return name.replace("_", "").replace('"', "").lower()
+
+
+def _is_distinctive(name: str) -> bool:
+    # Multi-word names (snake_case or camelCase) rarely collide by accident
+    return "_" in name.strip("_") or name[1:] != name[1:].lower()
+
+
+def _shorten(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_SIGNATURE_CHARS else text[:MAX_SIGNATURE_CHARS - 3] + "..."
+
+
+def _python_signature(node) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def python_definitions(code: str, path: str) -> List[Symbol]:
+    """Top-level functions and classes plus their methods; falls back to a line scan if the file does not parse."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return _scan_python_definitions(code, path)
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(Symbol(node.name, "function", path, node.lineno, _shorten(_python_signature(node))))
+        elif isinstance(node, ast.ClassDef):
+            symbols.append(Symbol(node.name, "class", path, node.lineno, _shorten(_python_signature(node))))
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and not item.name.startswith("__"):
+                    signature = _python_signature(item).replace(" ", f" {node.name}.", 1)
+                    symbols.append(Symbol(item.name, "method", path, item.lineno, _shorten(signature)))
+    return symbols
+
+
+def _scan_python_definitions(code: str, path: str) -> List[Symbol]:
+    symbols = []
+    current_class = None
+    for match in PY_DEF_RE.finditer(code):
+        indent, kind, name, rest = match.groups()
+        line = code.count("\n", 0, match.start()) + 1
+        signature = f"{kind} {name}{rest.split('#')[0].rstrip().rstrip(':')}"
+        if not indent:
+            current_class = name if kind == "class" else None
+            symbols.append(Symbol(name, "class" if kind == "class" else "function", path, line, _shorten(signature)))
+        elif current_class and kind == "def" and not name.startswith("__"):
+            signature = signature.replace(" ", f" {current_class}.", 1)
+            symbols.append(Symbol(name, "method", path, line, _shorten(signature)))
+    return symbols
+
+
+def sql_definitions(code: str, path: str) -> List[Symbol]:
+    symbols = []
+    for match in SQL_DEF_RE.finditer(code):
+        kind, name = match.group(1).lower(), match.group(2)
+        line = code.count("\n", 0, match.start()) + 1
+        # Show the header up to the end of the column or parameter list, if there is one
+        end = code.find("\n", match.end())
+        if code[match.end():].lstrip().startswith("("):
+            depth = 0
+            for i in range(match.end(), min(len(code), match.end() + MAX_SIGNATURE_CHARS * 4)):
+                depth += {"(": 1, ")": -1}.get(code[i], 0)
+                if depth == 0 and code[i] == ")":
+                    end = i + 1
+                    break
+        symbols.append(Symbol(name.split(".")[-1], kind, path, line,
+                              _shorten(code[match.start():end if end > 0 else len(code)])))
+    return symbols
+
+
+def definitions(code: str, path: str) -> List[Symbol]:
+    language = detect_language(path, code[:100].encode("utf-8"))
+    if language == "Python":
+        return python_definitions(code, path)
+    if language == "SQL":
+        return sql_definitions(code, path)
+    return []
+
+
+def python_references(code: str) -> Tuple[Set[str], Set[str], Set[str], Set[str], Set[str]]:
+    """(names used, attribute names called, names bound anywhere in the file, names bound by imports,
+    modules star-imported, relative ones keeping their leading dots)."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return _scan_python_references(code)
+    used, attributes, bound, imported, star_modules = set(), set(), set(), set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            (used if isinstance(node.ctx, ast.Load) else bound).add(node.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            attributes.add(node.func.attr)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ImportFrom) and node.names[0].name == "*":
+            star_modules.add("." * node.level + (node.module or ""))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imported.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+    return used, attributes, bound | imported, imported, star_modules
+
+
+def _scan_python_references(code: str) -> Tuple[Set[str], Set[str], Set[str], Set[str], Set[str]]:
+    code = PY_STRIP_RE.sub('""', code)
+    used = set(PY_CALL_RE.findall(code)) | set(PY_ANNOTATION_RE.findall(code))
+    attributes = set(PY_ATTR_CALL_RE.findall(code))
+    bound = set()
+    for match in PY_DEF_RE.finditer(code):
+        bound.add(match.group(3))
+        bound.update(PY_PARAM_RE.findall(match.group(4)))
+    imported = set()
+    for pattern in PY_BINDING_RES:
+        names = bound if pattern not in PY_IMPORT_RES else imported
+        for group in pattern.findall(code):
+            names.update(name.split(".")[0] for name in re.split(r"[\s,]+", group) if name)
+    return used, attributes, bound | imported, imported, set(PY_STAR_IMPORT_RE.findall(code))
+
+
+def _module_files(modules: Iterable[str], rel_path: str) -> Set[str]:
+    """Index paths that `from <module> import *` in `rel_path` may refer to, for each module."""
+    paths = set()
+    for module in modules:
+        name = module.lstrip(".")
+        level = len(module) - len(name)
+        base = name.replace(".", "/")
+        if level:
+            directory = os.path.dirname(rel_path)
+            for _ in range(level - 1):
+                directory = os.path.dirname(directory)
+            base = os.path.join(directory, base)
+        paths.update(os.path.normpath(p) for p in (f"{base}.py", os.path.join(base, "__init__.py")))
+    return paths
+
+
+def _in_module(path: str, module_files: Set[str]) -> bool:
+    # Absolute imports may be rooted below the repository (src/pkg/mod.py for `pkg.mod`)
+    return any(path == m or path.endswith(os.sep + m) for m in module_files)
+
+
+class SymbolIndex:
+    """Definitions and signatures of every Python/SQL file in a repository, persisted as JSON.
+
+    `refresh()` re-reads only files whose size or mtime changed since the index
+    was saved, so keeping the index file between runs makes rebuilding cheap.
+    """
+
+    def __init__(self, root: str, path: str = None):
+        self.root = os.path.abspath(root)
+        self.path = path or os.path.join(self.root, DEFAULT_INDEX_FILE)
+        self.files: Dict[str, dict] = {}  # relative path -> {"mtime", "size", "symbols"}
+        self.by_name: Dict[str, List[Symbol]] = {}
+        self.by_normal: Dict[str, Set[str]] = {}  # spelling-insensitive name -> names
+
+    @classmethod
+    def load(cls, root: str, path: str = None) -> "SymbolIndex":
+        index = cls(root, path)
+        try:
+            with open(index.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                index.files = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass  # missing or unreadable: rebuild from scratch
+        index._rebuild_names()
+        return index
+
+    def refresh(self, excludes: Iterable[str] = (), jobs: int = DEFAULT_WALK_JOBS) -> int:
+        """Re-index new and changed files and forget deleted ones; return how many files that touched."""
+        seen = {}
+        changed = 0
+        for file_path in walk_repo(self.root, excludes, INDEXED_LANGUAGES, jobs):
+            rel_path = os.path.relpath(file_path, self.root)
+            try:
+                stat = os.stat(file_path)
+                entry = self.files.get(rel_path)
+                if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                        symbols = definitions(f.read(), rel_path)
+                    entry = {"mtime": stat.st_mtime, "size": stat.st_size, "symbols": [asdict(s) for s in symbols]}
+                    changed += 1
+            except OSError:
+                continue
+            seen[rel_path] = entry
+        changed += len(self.files.keys() - seen.keys())
+        self.files = seen
+        self._rebuild_names()
+        return changed
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def _rebuild_names(self) -> None:
+        self.by_name = {}
+        for entry in self.files.values():
+            for data in entry["symbols"]:
+                symbol = Symbol(**data)
+                self.by_name.setdefault(symbol.name, []).append(symbol)
+        self.by_normal = {}
+        for name in self.by_name:
+            self.by_normal.setdefault(_normalize(name), set()).add(name)
+
+    def _relative(self, file_path: str) -> str:
+        return os.path.relpath(os.path.abspath(file_path), self.root)
+
+    def context_for(self, code: str, file_path: str, max_tokens: int = DEFAULT_CONTEXT_TOKENS) -> str:
+        """A prompt block with the signatures of symbols this file uses from other files, and names
+        it uses without defining or (for Python) importing them, with close matches, trimmed to
+        `max_tokens`."""
+        rel_path = self._relative(file_path)
+        language = detect_language(file_path, code[:100].encode("utf-8"))
+        own = definitions(code, rel_path)
+        own_names = {s.name for s in own}
+        if language == "Python":
+            used, attributes, bound, imported, star_modules = python_references(code)
+            unbound = used - bound - KNOWN_NAMES - own_names
+            # Another file's names are only visible through an import; `from module import *`
+            # brings in everything that module defines
+            star_files = _module_files(star_modules, rel_path)
+            starred = {name for name in unbound if any(_in_module(s.path, star_files)
+                                                       for s in self.by_name.get(name, ()))}
+            unbound -= starred
+            # Local variables shadow everything else; attribute calls only point somewhere
+            # useful when the method name is distinctive (obj.load_rows(), not queue.put())
+            wanted = sorted(used & imported | starred)
+            wanted += sorted(a for a in attributes - own_names
+                             if _is_distinctive(a) and len(self.by_name.get(a, ())) == 1)
+        elif language == "SQL":
+            used = {name.split(".")[-1] for name in SQL_REF_RE.findall(code)}
+            unbound = used - own_names
+            starred, star_files = set(), set()
+            wanted = sorted(unbound)
+        else:
+            return ""
+
+        related = []
+        for name in wanted:
+            found = [s for s in self.by_name.get(name, ()) if s.path != rel_path]
+            if name in starred:
+                found = [s for s in found if _in_module(s.path, star_files)]
+            if 0 < len(found) <= MAX_DEFINITIONS:
+                related.extend(found)
+
+        own_by_name = {s.name: s for s in own}
+        missing = []
+        for name in sorted(unbound):
+            if language == "SQL" and name in self.by_name:
+                continue
+            normal = _normalize(name)
+            local = sorted(n for n in own_by_name if _normalize(n) == normal and n != name)
+            if local:
+                # A respelling of this file's own definition (s3manager for S3Manager) beats a same-named
+                # definition elsewhere
+                hints = ", ".join(f"{n} ({rel_path}:{own_by_name[n].line})" for n in local)
+                missing.append(f"- {name}: did you mean {hints}?")
+                continue
+            elsewhere = [s for s in self.by_name.get(name, ()) if s.path != rel_path]
+            if elsewhere:
+                # Defined in another file that this one never imports: a NameError at run time
+                hints = ", ".join(f"{s.path}:{s.line}" for s in elsewhere[:MAX_DEFINITIONS])
+                missing.append(f"- {name}: not imported (defined in {hints})")
+                continue
+            matches = sorted((self.by_normal.get(normal, set()) | {n for n in own_by_name if _normalize(n) == normal})
+                             - {name})
+            if not matches:
+                candidates = (self.by_name.keys() | own_by_name.keys()) - {name}
+                matches = difflib.get_close_matches(name, candidates, n=2, cutoff=0.8)
+            if matches:
+                # Point at this file's own definition when there is one, since the index may be older
+                found = [own_by_name.get(m) or self.by_name[m][0] for m in matches]
+                hints = ", ".join(f"{s.name} ({s.path}:{s.line})" for s in found)
+                missing.append(f"- {name}: did you mean {hints}?")
+            elif language == "Python":
+                # Tables defined outside the repository are normal; undefined Python names are not
+                missing.append(f"- {name}")
+
+        # Undefined names are the likeliest bugs, so they get the budget first
+        sections = []
+        if missing:
+            sections.append(("Names used in this file that it neither defines nor imports:" if language == "Python"
+                             else "Names used in this file that are not defined in the repository:", missing))
+        if related:
+            sections.append(("Definitions from other files that this file uses (for reference; do not review them):",
+                             [f"- {s.describe()}" for s in related]))
+        lines = []
+        budget = max_tokens
+        for header, items in sections:
+            cost = count_tokens(header)
+            if cost + count_tokens(items[0]) > budget:
+                break
+            lines.append(header)
+            budget -= cost
+            for item in items:
+                cost = count_tokens(item)
+                if cost > budget:
+                    break
+                lines.append(item)
+                budget -= cost
+        return "\n".join(lines)
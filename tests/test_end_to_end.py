@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+import ai_reviewer
+import mock_llm_server
+from llm_backend import MockBackend, OpenAIBackend, set_backend
+
+
+class CountingBackend(MockBackend):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def stream(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return super().stream(messages, *args, **kwargs)
+
+
+@pytest.fixture
+def mock_server():
+    backend = CountingBackend()
+    server = mock_llm_server.serve(port=0, backend=backend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAIBackend(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    set_backend(client)
+    yield backend
+    set_backend(None)
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def large_file(tmp_path):
+    path = tmp_path / "large.py"
+    path.write_text("\n\n".join(f"def step_{i}(x):\n    y = x + {i}\n    return y * 2\n" for i in range(60)))
+    return path
+
+
+def test_oversized_file_is_chunked_and_merged(mock_server, large_file, capsys):
+    code = ai_reviewer.main([str(large_file), "--no-cache", "--max-prompt-tokens", "300", "--format", "jsonl"])
+
+    assert code == 0
+    assert len(mock_server.prompts) > 1
+    findings = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    line_count = len(large_file.read_text().splitlines())
+    assert findings
+    assert all(f["file"] == str(large_file) and 1 <= f["line_start"] <= line_count for f in findings)
+    assert len({(f["line_start"], f["message"]) for f in findings}) == len(findings)
+
+
+def test_text_report(mock_server, large_file, capsys):
+    code = ai_reviewer.main([str(large_file), "--no-cache", "--max-prompt-tokens", "300"])
+
+    out = capsys.readouterr().out
+    assert code == 0
+    assert f"🔍 Reviewing: {large_file}" in out
+    assert "- L" in out
+    assert "❌" not in out
+
+
+def test_text_dedup_asks_for_line_anchors(mock_server, tmp_path, capsys):
+    original = tmp_path / "original.py"
+    original.write_text("\n\n".join(f"def step_{i}(x):\n    return x + {i}\n" for i in range(20)))
+    copy = tmp_path / "copy.py"
+    copy.write_text(original.read_text().replace("x + 3\n", "x - 3\n"))
+
+    code = ai_reviewer.main([str(original), str(copy), "--no-cache", "--dedup", "--dedup-similarity", "0.5",
+                             "--small-file-tokens", "0"])
+
+    out = capsys.readouterr().out
+    assert code == 0
+    assert "`L<number>:`" in mock_server.prompts[0]
+    assert "♻️" in out
+    assert len(mock_server.prompts) == 2
@@ -0,0 +1,34 @@
+from repo_walker import is_ignored, parse_ignore_line, walk_repo
+
+
+def rules(*lines, base=""):
+    return [parse_ignore_line(line, base) for line in lines]
+
+
+def test_root_anchored_directory_pattern():
+    anchored = rules("/build/")
+    assert is_ignored(anchored, "build", True)
+    assert not is_ignored(anchored, "src/build", True)
+    assert not is_ignored(anchored, "build", False)
+
+
+def test_unanchored_directory_pattern_matches_at_any_depth():
+    unanchored = rules("build/")
+    assert is_ignored(unanchored, "build", True)
+    assert is_ignored(unanchored, "src/build", True)
+
+
+def test_inner_slash_anchors_and_negation_overrides():
+    assert not is_ignored(rules("docs/*.sql"), "src/docs/a.sql", False)
+    assert not is_ignored(rules("*.sql", "!keep.sql"), "keep.sql", False)
+
+
+def test_walk_skips_only_the_root_directory(tmp_path):
+    (tmp_path / ".gitignore").write_text("/out/\n")
+    for directory in ("out", "src/out"):
+        (tmp_path / directory).mkdir(parents=True)
+        (tmp_path / directory / "q.sql").write_text("SELECT 1;\n")
+
+    found = sorted(walk_repo(str(tmp_path), languages={"SQL"}))
+
+    assert found == [str(tmp_path / "src" / "out" / "q.sql")]
@@ -0,0 +1,21 @@
+from review_cache import ReviewCache, cache_key
+
+
+def test_round_trip(tmp_path):
+    cache = ReviewCache(str(tmp_path))
+    key = cache_key("v1", "SELECT 1;")
+    cache.put(key, "- looks fine")
+
+    assert cache.get(key) == "- looks fine"
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_unwritable_cache_does_not_raise(tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    cache = ReviewCache(str(blocker / "cache"))
+    key = cache_key("v1", "SELECT 1;")
+
+    cache.put(key, "- looks fine")
+
+    assert cache.get(key) is None
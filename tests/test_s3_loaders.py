@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("snowflake.connector")
+pytest.importorskip("boto3")
+pytest.importorskip("pandas")
+
+import s3_sf_dataload
+import s3_to_sf_dataload
+
+KEY = "data/input/o'brien\\2026/t1.csv"
+
+
+class FakeCursor:
+    description = [("file",), ("status",), ("rows_loaded",)]
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+
+    def fetchall(self):
+        return [(f"s3://your_s3_bucket/{KEY}", "LOADED", 3)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_sql_string_escapes_quotes_and_backslashes():
+    for module in (s3_sf_dataload, s3_to_sf_dataload):
+        assert module.sql_string(KEY) == "'data/input/o''brien\\\\2026/t1.csv'"
+
+
+def test_copy_files_quotes_keys():
+    manager = s3_sf_dataload.SnowflakeManager.__new__(s3_sf_dataload.SnowflakeManager)
+    manager.conn = FakeConnection()
+
+    results = manager.copy_files("your_schema.T1", [KEY], "CSV")
+
+    assert "FILES = ('data/input/o''brien\\\\2026/t1.csv')" in manager.conn.queries[0]
+    assert results[KEY]["rows_loaded"] == 3
+
+
+def test_load_files_to_snowflake_quotes_keys():
+    conn = FakeConnection()
+
+    s3_to_sf_dataload.load_files_to_snowflake(conn, "your_s3_bucket", [KEY], "T1")
+
+    assert "FILES = ('data/input/o''brien\\\\2026/t1.csv')" in conn.queries[0]
@@ -0,0 +1,30 @@
+from symbol_index import SymbolIndex
+
+FILES = {
+    "loader.py": "class S3Manager:\n    def read_rows(self):\n        pass\n",
+    "respelled.py": "class s3manager:\n    pass\n\n\ndef main():\n    return S3Manager()\n",
+    "unimported.py": "def main():\n    return S3Manager()\n",
+    "imported.py": "from loader import S3Manager\n\n\ndef main():\n    return S3Manager()\n",
+}
+
+
+def context(tmp_path, name):
+    for path, code in FILES.items():
+        (tmp_path / path).write_text(code)
+    index = SymbolIndex(str(tmp_path), str(tmp_path / "index.json"))
+    index.refresh()
+    return index.context_for(FILES[name], str(tmp_path / name), 400)
+
+
+def test_own_respelling_comes_before_other_files(tmp_path):
+    assert "- S3Manager: did you mean s3manager (respelled.py:1)?" in context(tmp_path, "respelled.py")
+
+
+def test_name_from_another_file_needs_an_import(tmp_path):
+    assert "- S3Manager: not imported (defined in loader.py:1)" in context(tmp_path, "unimported.py")
+
+
+def test_imported_name_is_quoted_as_a_definition(tmp_path):
+    text = context(tmp_path, "imported.py")
+    assert "- loader.py:1 class S3Manager" in text
+    assert "not imported" not in text